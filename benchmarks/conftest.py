@@ -0,0 +1,52 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+
+def gaussian_blobs(shape, n_blobs, n_frames=None, sigma=2.0, seed=0):
+    """Image of n_blobs gaussian blobs at random positions on a noisy background, or
+    a time series of n_frames such images."""
+
+    rng = np.random.default_rng(seed)
+    if n_frames is not None:
+        return np.stack(
+            [
+                gaussian_blobs(shape, n_blobs, sigma=sigma, seed=(seed, t))
+                for t in range(n_frames)
+            ]
+        )
+
+    img = np.zeros(shape, dtype=np.float32)
+    positions = tuple(rng.integers(0, n, size=n_blobs) for n in shape)
+    img[positions] = 1000 * (2 * np.pi * sigma**2) ** (len(shape) / 2)
+    gaussian_filter(img, sigma, output=img)
+    img += rng.normal(10, 2, size=shape).astype(np.float32)
+    return np.clip(img, 0, None).astype(np.uint16)
+
+
+@pytest.fixture
+def blobs():
+    return gaussian_blobs
+
+
+@pytest.fixture
+def measure(benchmark):
+    """Benchmark func(*args), and record its peak memory use (as traced by
+    tracemalloc, in a separate run) in the benchmark's extra info"""
+
+    def run(func, *args, rounds=None):
+        tracemalloc.start()
+        try:
+            func(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory_mib"] = round(peak / 2**20, 2)
+
+        if rounds is None:
+            return benchmark(func, *args)
+        return benchmark.pedantic(func, args, rounds=rounds, iterations=1)
+
+    return run
@@ -0,0 +1,66 @@
+from dataclasses import replace
+
+import pytest
+
+from napari_trackpy_point_detection.utilities.detection import (
+    DetectionParameters,
+    detect,
+    downsample_and_blur,
+)
+
+pytest.importorskip("pytest_benchmark")
+
+# (frame shape, number of frames or None, number of blobs per frame), per path
+IMAGES = {
+    "2D": [((512, 512), None, 200), ((2048, 2048), None, 3000)],
+    "2D+t": [((512, 512), 4, 200), ((512, 512), 16, 200)],
+    "3D": [((32, 256, 256), None, 400), ((64, 512, 512), None, 3000)],
+    "3D+t": [((32, 256, 256), 2, 400), ((32, 256, 256), 8, 400)],
+}
+CASES = [
+    pytest.param(
+        path,
+        shape,
+        n_frames,
+        n_blobs,
+        id=f"{path}-{'x'.join(map(str, (n_frames or 1, *shape)))}",
+    )
+    for path, images in IMAGES.items()
+    for shape, n_frames, n_blobs in images
+]
+
+PARAMS = DetectionParameters(
+    diameter_xy=7,
+    diameter_z=5,
+    separation_xy=8.0,
+    separation_z=5.0,
+    downsample_xy=2,
+    downsample_z=1,
+    sigma_xy=1,
+    sigma_z=1,
+)
+
+
+@pytest.mark.parametrize(
+    ("shape", "factors", "sigmas"),
+    [
+        ((2048, 2048), [4, 4], [2, 2]),
+        ((4096, 4096), [4, 4], [2, 2]),
+        ((64, 512, 512), [2, 4, 4], [1, 2, 2]),
+        ((128, 1024, 1024), [2, 4, 4], [1, 2, 2]),
+    ],
+    ids=lambda value: "x".join(map(str, value)),
+)
+def test_downsample_and_blur(measure, blobs, shape, factors, sigmas):
+    img = blobs(shape, n_blobs=1000)
+    buffers = {}
+
+    measure(downsample_and_blur, img, factors, sigmas, buffers)
+
+
+@pytest.mark.parametrize(("path", "shape", "n_frames", "n_blobs"), CASES)
+def test_detect(measure, blobs, path, shape, n_frames, n_blobs):
+    img = blobs(shape, n_blobs, n_frames)
+    params = replace(PARAMS, use_z=path.startswith("3D"))
+
+    measure(detect, img, params, rounds=3)
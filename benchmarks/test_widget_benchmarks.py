@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from napari_trackpy_point_detection.utilities.interactive_table_widget import (
+    InteractiveTableWidget,
+)
+from napari_trackpy_point_detection.utilities.measure_widget import (
+    MeasureWidget,
+)
+from napari_trackpy_point_detection.utilities.selection_widget import (
+    SelectionWidget,
+)
+
+pytest.importorskip("pytest_benchmark")
+
+N_POINTS = [10_000, 100_000, 1_000_000]
+SHAPE = (64, 512, 512)
+
+
+def detections(n_points, seed=0):
+    """Random detections in SHAPE, with the columns trackpy adds"""
+
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        rng.uniform(0, SHAPE, size=(n_points, 3)), columns=["z", "y", "x"]
+    )
+    for column in ("mass", "size", "ecc", "signal", "raw_mass"):
+        df[column] = rng.lognormal(size=n_points)
+    return df
+
+
+@pytest.mark.parametrize("n_points", N_POINTS)
+def test_filter_objects(measure, make_napari_viewer, n_points):
+    viewer = make_napari_viewer()
+    image = viewer.add_image(np.zeros(SHAPE, dtype=np.uint8))
+    widget = SelectionWidget(viewer)
+    widget._start_detection(image)
+    widget._update_points_and_sliders(detections(n_points), image)
+
+    slider = next(s for s in widget.sliders if s.name == "mass")
+    low, high = slider.range_slider.minimum(), slider.range_slider.maximum()
+    ranges = iter(np.linspace((low, high), ((low + high) / 2, high), 2**16))
+
+    def filter_objects():
+        # each call moves the lower bound, as dragging the slider does
+        slider.range_slider.setValue(tuple(next(ranges)))
+        widget._filter_objects.flush()
+
+    measure(filter_objects)
+
+
+@pytest.mark.parametrize("sort_by", [None, "mass"])
+@pytest.mark.parametrize("n_points", N_POINTS)
+def test_set_table_data(measure, make_napari_viewer, n_points, sort_by):
+    viewer = make_napari_viewer()
+    df = detections(n_points)
+    points = viewer.add_points(df[["z", "y", "x"]].to_numpy())
+    table = InteractiveTableWidget(points, viewer)
+    table.df = df
+
+    column_index = None if sort_by is None else df.columns.get_loc(sort_by)
+    measure(table._set_data, column_index)
+
+
+@pytest.mark.parametrize("lazy", [False, True], ids=["numpy", "dask"])
+@pytest.mark.parametrize("n_points", N_POINTS)
+def test_sample(measure, make_napari_viewer, blobs, n_points, lazy):
+    viewer = make_napari_viewer()
+    img = blobs(SHAPE, n_blobs=1000)
+    if lazy:
+        import dask.array as da
+
+        img = da.from_array(img, chunks=(8, 128, 128))
+    image = viewer.add_image(img)
+    df = detections(n_points)
+    points = viewer.add_points(df[["z", "y", "x"]].to_numpy())
+    table = InteractiveTableWidget(points, viewer)
+    widget = MeasureWidget(viewer, table)
+
+    measure(widget._sample, image)
@@ -1,5 +1,16 @@
 __version__ = "0.0.1"
 
-from .widget import PointDetection
+from .utilities.detection import DetectionParameters, detect
 
-__all__ = ("PointDetection",)
+__all__ = ("DetectionParameters", "PointDetection", "detect")
+
+
+def __getattr__(name: str):
+    # The widget is only imported when asked for, so that the detection can run
+    # headless, without importing Qt.
+    if name == "PointDetection":
+        from .widget import PointDetection
+
+        return PointDetection
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from napari_trackpy_point_detection.utilities.deletion_history import (
+    Deletion,
+    DeletionHistory,
+    restore_points,
+    restore_rows,
+)
+
+
+def _deletion(indices, rows=None):
+    indices = np.asarray(indices)
+    return Deletion(
+        indices=indices,
+        points=np.zeros((len(indices), 2)),
+        rows=indices if rows is None else np.asarray(rows),
+        table_rows=pd.DataFrame({"y": np.zeros(len(indices))}, index=indices),
+    )
+
+
+def test_restoring_puts_points_and_rows_back_in_place():
+    data = np.arange(12.0).reshape(6, 2)
+    df = pd.DataFrame({"y": data[:, 0]}).iloc[::-1]  # rows in reverse order
+    deletion = Deletion(
+        indices=np.array([1, 4]),
+        points=data[[1, 4]],
+        rows=np.array([1, 4]),
+        table_rows=df.iloc[[1, 4]],
+    )
+
+    kept = np.delete(data, deletion.indices, axis=0)
+    remaining = df.drop(index=deletion.indices)
+    remaining.index = [3, 2, 1, 0]
+
+    np.testing.assert_array_equal(restore_points(kept, deletion), data)
+    pd.testing.assert_frame_equal(restore_rows(remaining, deletion), df)
+
+
+def test_the_oldest_deletions_are_dropped_beyond_the_memory_limit():
+    nbytes = _deletion([0, 1]).nbytes
+    history = DeletionHistory(max_bytes=2 * nbytes)
+
+    for _ in range(3):
+        history.push(_deletion([0, 1]))
+    assert len(history._undo) == 2
+
+    history.undo()
+    assert history.can_redo
+    history.push(_deletion([0, 1]))
+    assert not history.can_redo
+    assert len(history._undo) == 2
@@ -0,0 +1,328 @@
+from dataclasses import replace
+
+import dask.array as da
+import numpy as np
+import pandas as pd
+import pytest
+import trackpy
+from scipy.ndimage import gaussian_filter
+
+from napari_trackpy_point_detection.cli import main, read_image
+from napari_trackpy_point_detection.utilities.detection import (
+    DetectionParameters,
+    detect,
+    detect_frame,
+    downsample_and_blur,
+    iter_locate_frames,
+    locate_frames,
+    squeeze,
+)
+from napari_trackpy_point_detection.utilities.frame_cache import FrameCache
+
+SETTINGS = {
+    "diameter": [7, 7],
+    "separation": [8.0, 8.0],
+    "percentile": 64,
+    "downsample": [1, 1],
+    "sigmas": [1, 1],
+}
+
+
+def blobs(n_frames=4, shape=(64, 64), n_blobs=6, seed=0):
+    """Time series of gaussian blobs at random positions, on a noisy background."""
+
+    rng = np.random.default_rng(seed)
+    yy, xx = np.indices(shape)
+    frames = rng.normal(10, 1, size=(n_frames, *shape))
+    for frame in frames:
+        for y, x in rng.uniform(8, np.array(shape) - 8, size=(n_blobs, 2)):
+            frame += 200 * np.exp(-((yy - y) ** 2 + (xx - x) ** 2) / 8)
+    return frames.astype(np.uint16)
+
+
+def test_parallel_detection_matches_serial_detection():
+    img = blobs()
+
+    serial = locate_frames(img, **SETTINGS)
+    parallel = locate_frames(img, **SETTINGS, n_workers=2)
+
+    assert sorted(serial["t"].unique()) == [0, 1, 2, 3]
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_detection_on_dask_frames(n_workers):
+    img = blobs()
+
+    expected = locate_frames(img, **SETTINGS)
+    result = locate_frames(
+        da.from_array(img, chunks=(1, 32, 32)), **SETTINGS, n_workers=n_workers
+    )
+
+    pd.testing.assert_frame_equal(expected, result)
+
+
+def test_detect_matches_frame_by_frame_detection():
+    img = blobs()
+    params = DetectionParameters(
+        diameter_xy=7,
+        separation_xy=8.0,
+        downsample_xy=1,
+        sigma_xy=1,
+    )
+
+    result = detect(img, params)
+
+    expected = locate_frames(img, **SETTINGS).round(3)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_detect_frame_matches_detection_in_that_frame():
+    img = blobs(shape=(96, 96), n_blobs=10)
+    params = DetectionParameters(
+        diameter_xy=7, separation_xy=8.0, downsample_xy=2, sigma_xy=1
+    )
+
+    full = detect(img, params)
+    frame = detect_frame(img, params, t=2)
+    pd.testing.assert_frame_equal(frame, full[full["t"] == 2].reset_index(drop=True))
+
+    # objects away from the border of a region are found at the same positions
+    region = detect_frame(img, params, t=2, region=(slice(21, 80), slice(None)))
+    assert region["y"].between(20, 80).all()
+    inner = frame[frame["y"].between(30, 70)].sort_values(["y", "x"])
+    cropped = region[region["y"].between(30, 70)].sort_values(["y", "x"])
+    np.testing.assert_allclose(cropped[["y", "x"]], inner[["y", "x"]], atol=0.05)
+
+
+def test_cached_regions_with_the_same_origin_are_kept_apart():
+    img = blobs(shape=(96, 96), n_blobs=10)
+    params = DetectionParameters(
+        diameter_xy=7, separation_xy=8.0, downsample_xy=1, sigma_xy=1
+    )
+    cache = FrameCache()
+
+    small = (slice(0, 40), slice(0, 40))
+    large = (slice(0, 96), slice(0, 96))
+    detect_frame(img, params, t=1, region=small, cache=cache, image_key="img")
+    result = detect_frame(
+        img, params, t=1, region=large, cache=cache, image_key="img"
+    )
+
+    expected = detect_frame(img, params, t=1, region=large)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("max_bytes", [0, 2 * 1024**2])
+def test_frames_preprocessed_into_buffers_are_cached_as_copies(max_bytes):
+    img = blobs(n_frames=3)
+    settings = {**SETTINGS, "downsample": [2, 2]}
+    cache = FrameCache(max_bytes=max_bytes)
+
+    expected = [d for _, d in iter_locate_frames(img, **settings)]
+    results = [
+        d
+        for _, d in iter_locate_frames(
+            img, **settings, cache=cache, image_key="img"
+        )
+    ]
+    cached = [cache.get(("img", t, (2, 2), (1, 1))) for t in range(3)]
+
+    for d, e in zip(results, expected, strict=True):
+        pd.testing.assert_frame_equal(d, e)
+    if max_bytes == 0:
+        assert cached == [None] * 3
+        return
+    for t, frame in enumerate(cached):
+        np.testing.assert_array_equal(
+            frame, downsample_and_blur(img[t], [2, 2], [1, 1])
+        )
+    assert not np.shares_memory(cached[0], cached[1])
+
+    # the second time, the frames are taken from the cache
+    rerun = iter_locate_frames(img, **settings, cache=cache, image_key="img")
+    for (_, d), e in zip(rerun, expected, strict=True):
+        pd.testing.assert_frame_equal(d, e)
+
+
+def test_detect_rejects_images_without_2_to_4_dimensions():
+    with pytest.raises(ValueError, match="2-4 dimensions"):
+        detect(np.zeros(10), DetectionParameters())
+
+
+def test_command_line_detection(tmp_path):
+    img = blobs()
+    np.save(tmp_path / "img.npy", img)
+
+    main(
+        [
+            str(tmp_path / "img.npy"),
+            str(tmp_path / "points.csv"),
+            "--diameter-xy", "7",
+            "--separation-xy", "8",
+            "--downsample-xy", "1",
+            "--sigma-xy", "1",
+        ]
+    )
+
+    result = pd.read_csv(tmp_path / "points.csv")
+    expected = detect(
+        img,
+        DetectionParameters(
+            diameter_xy=7, separation_xy=8.0, downsample_xy=1, sigma_xy=1
+        ),
+    )
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_command_line_reads_tiff_frames_lazily(tmp_path):
+    tifffile = pytest.importorskip("tifffile")
+    pytest.importorskip("zarr")
+    img = blobs()[:, None]  # with an axis of length 1, as e.g. a channel axis
+    tifffile.imwrite(tmp_path / "img.tif", img)
+
+    lazy = read_image(tmp_path / "img.tif")
+    assert isinstance(lazy, da.Array)
+    assert lazy.chunks[0] == (1,) * len(img)
+
+    main([str(tmp_path / "img.tif"), str(tmp_path / "points.csv")])
+
+    result = pd.read_csv(tmp_path / "points.csv")
+    expected = detect(img[:, 0], DetectionParameters())
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize(
+    ("percentile", "n_workers"), [(0, 1), (64, 1), (64, 2)]
+)
+def test_tiled_detection_finds_the_same_bright_objects(percentile, n_workers):
+    n_blobs = 30
+    img = blobs(n_frames=1, shape=(160, 160), n_blobs=n_blobs)[0]
+    params = DetectionParameters(
+        diameter_xy=7,
+        separation_xy=8.0,
+        percentile=percentile,
+        downsample_xy=2,
+        sigma_xy=1,
+        n_workers=n_workers,
+    )
+
+    expected = detect(img, params)
+    result = detect(
+        da.from_array(img, chunks=(64, 64)), replace(params, tile_size=64)
+    )
+
+    # Tiles are rescaled and thresholded on their own, so only the objects well above
+    # the threshold (the blobs) are certain to be found in both, at the same position.
+    bright = expected.nlargest(n_blobs // 2, "mass")
+    distances = np.hypot(
+        bright["y"].to_numpy()[:, None] - result["y"].to_numpy(),
+        bright["x"].to_numpy()[:, None] - result["x"].to_numpy(),
+    )
+    assert distances.min(axis=1).max() < 0.05
+    # the dim ones can differ
+    assert abs(len(result) - len(expected)) <= 0.15 * len(expected)
+
+
+def test_squeeze_neither_loads_nor_copies_the_data(tmp_path):
+    img = np.lib.format.open_memmap(
+        tmp_path / "img.npy", mode="w+", dtype=np.uint16, shape=(1, 8, 1, 16)
+    )
+
+    squeezed = squeeze(img)
+    assert squeezed.shape == (8, 16)
+    assert np.shares_memory(squeezed, img)
+
+    lazy = squeeze(da.zeros((1, 8, 16), chunks=(1, 4, 4)))
+    assert isinstance(lazy, da.Array)
+    assert lazy.shape == (8, 16)
+
+
+@pytest.mark.parametrize(
+    ("factors", "sigmas"), [([2, 4, 4], [1, 2, 2]), ([2, 3, 3], [1, 1, 1])]
+)
+def test_downsample_and_blur_matches_float64_computation(factors, sigmas):
+    img = np.random.default_rng(0).integers(
+        0, 2**16, size=(9, 40, 41), dtype=np.uint16
+    )
+
+    # bin and blur in float64
+    cropped = img[
+        tuple(
+            slice(0, (s // f) * f)
+            for s, f in zip(img.shape, factors, strict=True)
+        )
+    ]
+    expected = cropped.reshape(
+        [
+            n
+            for s, f in zip(cropped.shape, factors, strict=True)
+            for n in (s // f, f)
+        ]
+    ).mean(axis=(1, 3, 5))
+    if any(s != 1 for s in sigmas):
+        expected = gaussian_filter(expected, sigmas)
+
+    buffers = {}
+    result = downsample_and_blur(img, factors, sigmas, buffers)
+
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result, expected, atol=1e-5 * 2**16)
+
+    # the next frame is preprocessed into the same array
+    assert downsample_and_blur(img, factors, sigmas, buffers) is result
+
+
+def baseline_downsample_and_blur(img, factors, sigmas):
+    """The preprocessing before it computed in float32: binning averages in float64,
+    and blurring keeps the dtype of its input."""
+
+    if not all(f == 1 for f in factors):
+        cropped = img[
+            tuple(
+                slice(0, (s // f) * f)
+                for s, f in zip(img.shape, factors, strict=True)
+            )
+        ]
+        img = cropped.reshape(
+            [
+                n
+                for s, f in zip(cropped.shape, factors, strict=True)
+                for n in (s // f, f)
+            ]
+        ).mean(axis=tuple(range(1, 2 * img.ndim, 2)))
+    if not all(s == 1 for s in sigmas):
+        img = gaussian_filter(img, sigmas)
+    return img
+
+
+def test_blurring_without_binning_keeps_the_integer_dtype():
+    img = blobs(n_frames=1)[0]
+
+    result = downsample_and_blur(img, [1, 1], [2, 2], {})
+
+    assert result.dtype == img.dtype
+    np.testing.assert_array_equal(
+        result, baseline_downsample_and_blur(img, [1, 1], [2, 2])
+    )
+
+
+@pytest.mark.parametrize(
+    ("factors", "sigmas"), [([1, 1], [2, 2]), ([2, 2], [1, 1]), ([2, 2], [2, 2])]
+)
+def test_detections_match_the_baseline_preprocessing(factors, sigmas):
+    img = blobs(n_frames=1, shape=(128, 128), n_blobs=20)[0]
+    settings = {"diameter": 7, "separation": 8.0, "percentile": 64}
+
+    expected = trackpy.locate(
+        baseline_downsample_and_blur(img, factors, sigmas), **settings
+    )
+    result = trackpy.locate(
+        downsample_and_blur(img, factors, sigmas, {}), **settings
+    )
+
+    # float32 instead of float64 arithmetic only moves the positions slightly
+    assert len(result) == len(expected)
+    np.testing.assert_allclose(
+        result[["y", "x"]], expected[["y", "x"]], atol=1e-3
+    )
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from napari_trackpy_point_detection.utilities.filtering import RangeFilter
+
+
+def test_range_filter_matches_comparing_every_row():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {"mass": rng.integers(0, 1000, 500), "size": rng.uniform(1, 5, 500)}
+    )
+    df.loc[[3, 7], "size"] = np.nan
+
+    range_filter = RangeFilter(df, ["mass", "size"])
+    assert range_filter.mask.all()
+
+    # rows without a value fall outside any range
+    ranges = {"mass": (0, 1000), "size": (0.0, 6.0)}
+    for prop, (low, high) in ranges.items():
+        range_filter.set_range(prop, low, high)
+    assert list(np.flatnonzero(~range_filter.mask)) == [3, 7]
+
+    # widen and narrow the ranges in turn, from both sides
+    for prop, low, high in [
+        ("mass", 100, 900),
+        ("size", 2.0, 6.0),
+        ("mass", 300, 950),
+        ("size", 1.5, 3.0),
+        ("mass", 50, 400),
+        ("size", 0.0, 6.0),
+        ("mass", 400, 400),
+    ]:
+        ranges[prop] = (low, high)
+        range_filter.set_range(prop, low, high)
+
+        expected = np.ones(len(df), dtype=bool)
+        for name, (range_low, range_high) in ranges.items():
+            expected &= (df[name] >= range_low) & (df[name] <= range_high)
+        np.testing.assert_array_equal(range_filter.mask, expected)
+
+
+def test_a_cleared_range_keeps_rows_without_a_value():
+    df = pd.DataFrame({"size": [1.0, np.nan, 3.0]})
+    range_filter = RangeFilter(df, ["size"])
+
+    range_filter.set_range("size", 2.0, 4.0)
+    assert list(range_filter.mask) == [False, False, True]
+
+    range_filter.clear_range("size")
+    assert range_filter.mask.all()
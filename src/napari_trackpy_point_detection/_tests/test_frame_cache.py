@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from napari_trackpy_point_detection.utilities import detection
+from napari_trackpy_point_detection.utilities.detection import (
+    DetectionParameters,
+    detect,
+)
+from napari_trackpy_point_detection.utilities.frame_cache import FrameCache
+
+from .test_detection import blobs
+
+PARAMS = DetectionParameters(
+    diameter_xy=7, separation_xy=8.0, downsample_xy=2, sigma_xy=2
+)
+
+
+def frame(value, nbytes=100):
+    return np.full(nbytes, value, dtype=np.uint8)
+
+
+def test_least_recently_used_frames_are_dropped():
+    cache = FrameCache(max_bytes=250)
+    cache.put("a", frame(1))
+    cache.put("b", frame(2))
+    cache.get("a")  # now 'b' is the least recently used frame
+    cache.put("c", frame(3))
+
+    assert cache.get("b") is None
+    assert cache.get("a")[0] == 1
+    assert cache.get("c")[0] == 3
+    assert cache.nbytes == 200
+
+
+def test_dropped_frames_can_be_spilled_to_disk():
+    cache = FrameCache(max_bytes=250, spill_to_disk=True)
+    for i in range(4):
+        cache.put(i, frame(i))
+
+    assert cache.nbytes == 200
+    assert all(cache.get(i)[0] == i for i in range(4))
+
+    cache.spill_to_disk = False
+    assert sum(cache.get(i) is not None for i in range(4)) == 2
+
+
+def test_rerun_only_preprocesses_frames_once(monkeypatch):
+    img = blobs()
+    cache = FrameCache()
+
+    calls = []
+    preprocess = detection.preprocess
+    monkeypatch.setattr(
+        detection,
+        "preprocess",
+        lambda *args: calls.append(1) or preprocess(*args),
+    )
+
+    first = detect(img, PARAMS, cache, image_key="img")
+    assert len(calls) == len(img)
+
+    # another percentile only reruns trackpy.locate on the cached frames
+    params = DetectionParameters(**{**vars(PARAMS), "percentile": 90})
+    rerun = detect(img, params, cache, image_key="img")
+    assert len(calls) == len(img)
+
+    # other data is not mixed up with the cached frames
+    detect(img, PARAMS, cache, image_key="other")
+    assert len(calls) == 2 * len(img)
+
+    pd.testing.assert_frame_equal(first, detect(img, PARAMS))
+    pd.testing.assert_frame_equal(rerun, detect(img, params))
@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+import pytest
+from qtpy.QtWidgets import QApplication
+
+from napari_trackpy_point_detection.utilities.interactive_table_widget import (
+    InteractiveTableWidget,
+)
+
+POINTS = pd.DataFrame(
+    {
+        "z": [1.0, 2.0, 3.0, 4.0],
+        "y": [2.0, 8.0, 15.0, 4.0],
+        "x": [2.0, 8.0, 15.0, 9.0],
+        "mass": [10, 20, 30, 40],
+    }
+)
+
+
+@pytest.fixture
+def table(make_napari_viewer):
+    """A table widget on a points layer, with a measurement column."""
+
+    viewer = make_napari_viewer()
+    points = viewer.add_points(
+        POINTS[["z", "y", "x"]].to_numpy(), name="points"
+    )
+
+    table = InteractiveTableWidget(points, viewer)
+    table.df = POINTS.copy()
+    table.refresh()
+
+    return table
+
+
+def test_moving_a_point_only_updates_its_row(table):
+    layer = table._layer
+
+    data = layer.data.copy()
+    data[1] = [2.0, 9.0, 10.0]
+    layer._data = data
+    layer.events.data(
+        value=layer.data, action="changed", data_indices=(1,), vertex_indices=((),)
+    )
+
+    assert list(table.df.loc[1, ["z", "y", "x"]]) == [2.0, 9.0, 10.0]
+    assert np.isnan(table.df.loc[1, "mass"])
+    assert list(table.df["mass"].drop(index=1)) == [10, 30, 40]
+    model = table._table_widget.model()
+    assert model.index(1, 1).data() == 9.0
+
+
+def test_rows_follow_the_layer_when_points_are_added_or_removed(table):
+    layer = table._layer
+
+    # sort twice to toggle to descending, so that rows and points are in another order
+    column = table.df.columns.get_loc("y")
+    table._sort_table(column)
+    table._sort_table(column)
+
+    layer.remove([0, 2])
+    layer.add([[5.0, 6.0, 7.0]])
+
+    assert table._table_widget.model().rowCount() == 3
+    assert list(table.df.index) == [0, 1, 2]
+    np.testing.assert_array_equal(
+        table.df.sort_index()[["z", "y", "x"]].to_numpy(), layer.data
+    )
+    assert list(table.df.sort_index()["mass"].iloc[:2]) == [20, 40]
+
+
+def test_selections_follow_the_points_in_a_sorted_table(table):
+    layer = table._layer
+    selection_model = table._table_widget.selectionModel()
+
+    # sorted by mass, descending: the rows show points 3, 2, 1, 0
+    column = table.df.columns.get_loc("mass")
+    table._sort_table(column)
+    table._sort_table(column)
+
+    layer.selected_data = {0, 1, 3}
+    # rows 2 and 3 are selected as one range
+    assert len(selection_model.selection()) == 2
+    assert list(table._selected_table_rows()) == [0, 2, 3]
+    assert table._highlight_delegate._selected_rows == {0, 2, 3}
+
+    table._select_rows([1])
+    table._selection_changed(None, None)
+    assert set(layer.selected_data) == {2}
+
+
+def test_selected_rows_stay_highlighted_after_refreshing(table):
+    delegate = table._highlight_delegate
+    table.df["mass"] = table.df["mass"] / 3
+    table.refresh()
+    table._sort_table(table.df.columns.get_loc("mass"))
+
+    assert table._table_widget.itemDelegate() is delegate
+    index = table._table_widget.model().index(0, 3)
+    assert delegate.displayText(index.data(), None) == "3.333"
+
+
+def test_saving_the_table_in_the_background(table, qtbot, tmp_path):
+    path = tmp_path / "points.csv"
+
+    table._export_table(str(path))
+    qtbot.waitUntil(lambda: table._export_worker is None)
+
+    pd.testing.assert_frame_equal(
+        pd.read_csv(path, index_col=0), table.df, check_dtype=False
+    )
+
+
+def test_copying_the_selected_rows(table, qtbot):
+    table._select_rows([1, 3])
+
+    table._copy_table()
+    qtbot.waitUntil(lambda: table._copy_worker is None)
+
+    text = QApplication.clipboard().text()
+    assert text.splitlines() == [
+        "\tz\ty\tx\tmass",
+        "1\t2.0\t8.0\t8.0\t20",
+        "3\t4.0\t4.0\t9.0\t40",
+    ]
+
+
+def test_copying_too_many_rows_copies_a_file(table, qtbot, monkeypatch):
+    monkeypatch.setattr(table, "max_clipboard_rows", 2)
+
+    table._copy_table()
+    qtbot.waitUntil(lambda: table._export_worker is None)
+
+    urls = QApplication.clipboard().mimeData().urls()
+    assert len(urls) == 1
+    path = urls[0].toLocalFile()
+    read = pd.read_parquet if path.endswith(".parquet") else pd.read_csv
+    assert len(read(path)) == 4
+
+
+def test_deleting_the_selected_rows_removes_only_them(table):
+    model = table._table_widget.model()
+    reset = []
+    model.modelReset.connect(lambda: reset.append(True))
+
+    table._select_rows([0, 2])
+    table._delete_points()
+
+    assert model.rowCount() == 2
+    assert not reset
+    assert table.point_count_label.text() == "Number of points: 2"
+    np.testing.assert_array_equal(
+        table._layer.data, POINTS[["z", "y", "x"]].to_numpy()[[1, 3]]
+    )
+    assert list(table.df.index) == [0, 1]
+    assert list(table.df["mass"]) == [20, 40]
+    assert model.index(1, 3).data() == 40
+
+
+def test_deletions_can_be_undone_and_redone(table):
+    layer = table._layer
+    original_data = layer.data.copy()
+
+    # sorted by mass, descending, so that rows and points are in another order
+    column = table.df.columns.get_loc("mass")
+    table._sort_table(column)
+    table._sort_table(column)
+    original_df = table.df.copy()
+
+    table._select_rows([0, 2])  # points 3 and 1
+    table._delete_points()
+    deleted_once = (layer.data.copy(), table.df.copy())
+    table._select_rows([0])  # point 2
+    table._delete_points()
+
+    np.testing.assert_array_equal(layer.data, original_data[[0]])
+    assert list(table.df.index) == [0]
+
+    table._undo_delete_points()
+    np.testing.assert_array_equal(layer.data, deleted_once[0])
+    pd.testing.assert_frame_equal(table.df, deleted_once[1])
+
+    table._undo_delete_points()
+    np.testing.assert_array_equal(layer.data, original_data)
+    pd.testing.assert_frame_equal(table.df, original_df)
+    assert set(layer.selected_data) == {1, 3}
+    assert not table.undo_button.isEnabled()
+
+    table._redo_delete_points()
+    np.testing.assert_array_equal(layer.data, deleted_once[0])
+    pd.testing.assert_frame_equal(table.df, deleted_once[1])
+    assert table.redo_button.isEnabled()
+
+
+def test_redoing_a_deletion_after_sorting_removes_the_right_rows(table):
+    layer = table._layer
+    model = table._table_widget.model()
+
+    table._select_rows([0, 2])  # points 0 and 2
+    table._delete_points()
+    table._undo_delete_points()
+
+    # sorted by mass, descending: the rows show points 3, 2, 1, 0
+    column = table.df.columns.get_loc("mass")
+    table._sort_table(column)
+    table._sort_table(column)
+    sorted_df = table.df.copy()
+
+    table._redo_delete_points()
+    assert list(table.df["mass"]) == [40, 20]
+    assert [model.index(row, 3).data() for row in range(2)] == [40, 20]
+    np.testing.assert_array_equal(
+        layer.data, POINTS[["z", "y", "x"]].to_numpy()[[1, 3]]
+    )
+
+    table._undo_delete_points()
+    pd.testing.assert_frame_equal(table.df, sorted_df)
+    assert [model.index(row, 3).data() for row in range(4)] == [40, 30, 20, 10]
@@ -3,6 +3,7 @@ import numpy as np
 import pandas as pd
 import pytest
 from matplotlib.colors import to_rgba
+from qtpy.QtCore import Qt
 from qtpy.QtGui import QBrush
 
 from napari_trackpy_point_detection.utilities.interactive_table_widget import (
@@ -65,7 +66,9 @@ def regions(widgets):
 
 
 def row_background(table, row):
-    return table._table_widget.item(row, 0).background()
+    # rows without a region color have no background brush at all
+    model = table._table_widget.model()
+    return model.index(row, 0).data(Qt.BackgroundRole) or QBrush()
 
 
 def has_default_background(table, row):
@@ -78,9 +81,10 @@ def test_measure_adds_intensity_column(widgets):
     measure._measure()
 
     assert list(table.df["intensity"]) == expected_intensities()
+    model = table._table_widget.model()
     headers = [
-        table._table_widget.horizontalHeaderItem(col).text()
-        for col in range(table._table_widget.columnCount())
+        model.headerData(col, Qt.Horizontal)
+        for col in range(model.columnCount())
     ]
     assert "intensity" in headers
 
@@ -124,6 +128,39 @@ def test_measure_dask_image(widgets):
     assert list(table.df["intensity"]) == expected_intensities()
 
 
+def test_measure_neighbourhoods_adds_statistics_columns(widgets):
+    _, table, measure = widgets
+    measure.radius_spinbox_xy.setValue(1)
+    measure.radius_spinbox_z.setValue(1)
+    measure.background_spinbox.setValue(0)
+
+    measure._measure()
+
+    # the point itself and its six neighbours, in an image that increases by 1 along
+    # x, by 20 along y and by 400 along z
+    center = np.array(expected_intensities())
+    assert list(table.df["intensity_mean"]) == list(center)
+    assert list(table.df["intensity_max"]) == list(center + 400)
+    assert list(table.df["intensity_sum"]) == list(7 * center)
+    assert list(table.df["intensity_mass"]) == list(7 * center)
+
+    measure.radius_spinbox_xy.setValue(0)
+    measure._measure()
+    assert "intensity_mean" not in table.df.columns
+
+
+def test_measure_empty_points_layer(widgets):
+    viewer, table, measure = widgets
+    table._layer = viewer.add_points(ndim=3, name="empty")
+    table.df = POINTS.iloc[:0].copy()
+    table.refresh()
+    measure.radius_spinbox_xy.setValue(1)
+
+    measure._measure()
+
+    assert len(table.df) == 0
+
+
 def test_measure_in_regions_adds_region_column(widgets, regions):
     _, table, measure = widgets
 
@@ -151,6 +188,21 @@ def test_rows_are_colored_by_region(widgets, regions):
     assert has_default_background(table, 2)
 
 
+def test_row_colors_follow_a_new_colormap(widgets, regions):
+    _, table, measure = widgets
+    measure._measure()
+
+    regions.new_colormap()
+    measure._measure()
+
+    red, green, blue, _ = to_rgba(np.atleast_2d(regions.colormap.map(3))[0])
+    assert row_background(table, 0).color().getRgb()[:3] == (
+        int(red * 255),
+        int(green * 255),
+        int(blue * 255),
+    )
+
+
 def test_measuring_without_regions_drops_region_column(widgets, regions):
     _, table, measure = widgets
     measure._measure()
@@ -161,7 +213,7 @@ def test_measuring_without_regions_drops_region_column(widgets, regions):
     assert "region" not in table.df.columns
     assert all(
         has_default_background(table, row)
-        for row in range(table._table_widget.rowCount())
+        for row in range(table._table_widget.model().rowCount())
     )
 
 
@@ -0,0 +1,62 @@
+import json
+
+import dask.array as da
+import pytest
+
+from napari_trackpy_point_detection.utilities.detection import (
+    DetectionParameters,
+    detect,
+)
+from napari_trackpy_point_detection.utilities.profiling import (
+    Profiler,
+    set_profiler,
+)
+
+from .test_detection import blobs
+
+PARAMS = DetectionParameters(
+    diameter_xy=7, separation_xy=8.0, downsample_xy=2, sigma_xy=2
+)
+
+
+@pytest.fixture
+def profiler():
+    profiler = Profiler(trace_memory=True)
+    set_profiler(profiler)
+    yield profiler
+    set_profiler(None)
+
+
+def test_detection_stages_are_recorded_per_frame(profiler, tmp_path):
+    img = da.from_array(blobs(), chunks=(1, 32, 32))
+
+    detect(img, PARAMS)
+
+    records = profiler.to_dataframe()
+    for name in ("frame", "load", "bin", "blur", "locate", "rescale"):
+        assert sorted(records.loc[records["name"] == name, "frame"]) == [0, 1, 2, 3]
+    assert (records["wall"] >= 0).all()
+    # loading a frame allocates it
+    assert records.loc[records["name"] == "load", "peak"].min() > 0
+
+    summary = profiler.summary().set_index("name")
+    assert summary.loc["locate", "calls"] == 4
+    # a frame includes all the stages within it
+    assert summary.loc["frame", "wall"] >= summary.loc["locate", "wall"]
+
+    profiler.save_json(tmp_path / "timings.json")
+    saved = json.loads((tmp_path / "timings.json").read_text())
+    assert len(saved["records"]) == len(records)
+
+    profiler.save_chrome_trace(tmp_path / "trace.json")
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert {event["ph"] for event in events} == {"X"}
+    assert {event["name"] for event in events} >= {"frame", "locate"}
+
+
+def test_nothing_is_recorded_when_profiling_is_off():
+    profiler = Profiler()
+
+    detect(blobs(n_frames=1)[0], PARAMS)
+
+    assert profiler.records == []
@@ -0,0 +1,93 @@
+from dataclasses import replace
+
+import dask.array as da
+import pandas as pd
+import pytest
+
+from napari_trackpy_point_detection.utilities import result_store
+from napari_trackpy_point_detection.utilities.detection import (
+    DetectionParameters,
+    detect,
+)
+from napari_trackpy_point_detection.utilities.result_store import (
+    ResultStore,
+    image_fingerprint,
+    iter_detect_stored,
+)
+
+from .test_detection import blobs
+
+PARAMS = DetectionParameters(
+    diameter_xy=7, separation_xy=8.0, downsample_xy=1, sigma_xy=1
+)
+
+
+def test_fingerprint_changes_with_the_image():
+    img = blobs()
+
+    assert image_fingerprint(img) == image_fingerprint(img.copy())
+    assert image_fingerprint(img) != image_fingerprint(img, source="img.tif")
+
+    changed = img.copy()
+    changed[0, 0, 0] += 1
+    assert image_fingerprint(img) != image_fingerprint(changed)
+
+    lazy = da.from_array(img, chunks=(1, 32, 32))
+    assert image_fingerprint(lazy) == image_fingerprint(lazy + 0)
+
+
+def test_stored_detections_are_loaded_instead_of_detected(tmp_path, monkeypatch):
+    img = blobs()
+    store = ResultStore(tmp_path)
+
+    first = pd.concat(list(iter_detect_stored(img, PARAMS, store)), ignore_index=True)
+    pd.testing.assert_frame_equal(first, detect(img, PARAMS))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("should have been loaded from the store")
+
+    monkeypatch.setattr(result_store, "iter_detect", fail)
+
+    # the number of workers does not change the detections
+    params = replace(PARAMS, n_workers=2)
+    second = pd.concat(list(iter_detect_stored(img, params, store)), ignore_index=True)
+    pd.testing.assert_frame_equal(first, second)
+
+    params = replace(PARAMS, percentile=50)
+    with pytest.raises(AssertionError, match="loaded from the store"):
+        list(iter_detect_stored(img, params, store))
+
+
+def test_cancelled_runs_are_not_stored(tmp_path):
+    img = blobs()
+    store = ResultStore(tmp_path)
+
+    frames = iter_detect_stored(img, PARAMS, store)
+    next(frames)
+    frames.close()
+
+    assert store.load(image_fingerprint(img), PARAMS) is None
+
+
+def test_interrupted_runs_resume_from_the_stored_frames(tmp_path, monkeypatch):
+    img = blobs()
+    store = ResultStore(tmp_path)
+
+    frames = iter_detect_stored(img, PARAMS, store)
+    next(frames)
+    next(frames)
+    frames.close()
+
+    detected = []
+    original = result_store.iter_detect
+
+    def iter_detect(img, params, cache, image_key, time_points):
+        detected.extend(time_points)
+        return original(img, params, cache, image_key, time_points=time_points)
+
+    monkeypatch.setattr(result_store, "iter_detect", iter_detect)
+
+    result = pd.concat(list(iter_detect_stored(img, PARAMS, store)), ignore_index=True)
+    assert detected == [2, 3]
+    pd.testing.assert_frame_equal(result, detect(img, PARAMS))
+    assert len(store.load(image_fingerprint(img), PARAMS)) == 4
@@ -0,0 +1,152 @@
+import dask.array as da
+import numpy as np
+import pytest
+
+from napari_trackpy_point_detection.utilities import sampling
+from napari_trackpy_point_detection.utilities.sampling import (
+    STATISTICS,
+    chunk_boundaries,
+    ellipsoid_offsets,
+    neighbourhood_statistics,
+    sample_points,
+)
+
+RADIUS = [0, 1, 2, 2]
+BACKGROUND_RADIUS = [0, 2, 4, 4]
+
+
+@pytest.fixture
+def image_and_points():
+    rng = np.random.default_rng(0)
+    image = rng.random((3, 12, 30, 30))
+    points = rng.random((200, 4)) * (np.array(image.shape) - 1)
+    return image, points
+
+
+def test_ellipsoid_offsets_do_not_extend_axes_without_radius():
+    offsets = ellipsoid_offsets([0, 1, 1])
+
+    assert np.all(offsets[:, 0] == 0)
+    assert len(offsets) == 5  # the center and its four neighbours
+
+    shell = ellipsoid_offsets([0, 2, 2], inner_radius=[0, 1, 1])
+    assert not set(map(tuple, shell)) & set(map(tuple, offsets))
+
+
+def test_neighbourhood_statistics_match_each_point_measured_on_its_own(
+    image_and_points,
+):
+    image, points = image_and_points
+    statistics = neighbourhood_statistics(
+        image, points, RADIUS, BACKGROUND_RADIUS
+    )
+
+    neighbourhood = ellipsoid_offsets(RADIUS)
+    shell = ellipsoid_offsets(BACKGROUND_RADIUS, inner_radius=RADIUS)
+    for i, center in enumerate(np.round(points).astype(int)):
+        values, background = (
+            image[tuple(v[np.all((v >= 0) & (v < image.shape), axis=1)].T)]
+            for v in (center + neighbourhood, center + shell)
+        )
+        expected = [
+            values.mean(),
+            values.max(),
+            values.sum(),
+            background.mean(),
+            values.sum() - background.mean() * len(values),
+        ]
+        np.testing.assert_allclose(
+            [statistics[name][i] for name in STATISTICS], expected
+        )
+
+
+def test_dask_images_are_measured_per_chunk_like_numpy_images(
+    image_and_points,
+):
+    image, points = image_and_points
+
+    expected = neighbourhood_statistics(image, points, RADIUS, BACKGROUND_RADIUS)
+    measured = neighbourhood_statistics(
+        da.from_array(image, chunks=(1, 5, 13, 11)),
+        points,
+        RADIUS,
+        BACKGROUND_RADIUS,
+        max_values=500,
+    )
+
+    for name in STATISTICS:
+        np.testing.assert_allclose(measured[name], expected[name])
+
+
+def test_numpy_images_are_measured_in_blocks(image_and_points, monkeypatch):
+    image, points = image_and_points
+    expected = neighbourhood_statistics(image, points, RADIUS, BACKGROUND_RADIUS)
+
+    monkeypatch.setattr(sampling, "MAX_BLOCK_VOXELS", 2000)
+    # two planes of 30 x 30 per block
+    assert [len(b) - 1 for b in chunk_boundaries(image)] == [3, 6, 1, 1]
+
+    block_sizes = []
+    iter_chunk_groups = sampling.iter_chunk_groups
+
+    def recorded(*args):
+        for start, block, group in iter_chunk_groups(*args):
+            block_sizes.append(block.size)
+            yield start, block, group
+
+    monkeypatch.setattr(sampling, "iter_chunk_groups", recorded)
+    measured = neighbourhood_statistics(image, points, RADIUS, BACKGROUND_RADIUS)
+
+    for name in STATISTICS:
+        np.testing.assert_allclose(measured[name], expected[name])
+    # a block with the planes its neighbourhoods reach into on either side
+    assert max(block_sizes) <= (2 + 2 * BACKGROUND_RADIUS[1]) * 30 * 30
+
+
+class ChunkedArray:
+    """Array with zarr-like chunks, that records the regions read from it"""
+
+    def __init__(self, data, chunks):
+        self.data = data
+        self.chunks = chunks
+        self.shape = data.shape
+        self.ndim = data.ndim
+        self.dtype = data.dtype
+        self.reads = []
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        return self.data[index]
+
+
+def test_points_are_sampled_once_per_chunk(image_and_points):
+    image, points = image_and_points
+    chunked = ChunkedArray(image, chunks=(1, 4, 10, 10))
+
+    values = sample_points(chunked, points)
+
+    centers = tuple(np.round(points).astype(int).T)
+    np.testing.assert_array_equal(values, image[centers])
+    # each read covers exactly one chunk, and no chunk is read twice
+    assert len(set(map(str, chunked.reads))) == len(chunked.reads)
+    assert all(
+        s.stop - s.start <= c
+        for index in chunked.reads
+        for s, c in zip(index, chunked.chunks, strict=True)
+    )
+
+    dask_image = da.from_array(image, chunks=(1, 5, 13, 11))
+    np.testing.assert_array_equal(sample_points(dask_image, points), values)
+
+
+def test_no_points_give_empty_results(image_and_points):
+    image, _ = image_and_points
+    dask_image = da.from_array(image, chunks=(1, 5, 13, 11))
+    points = np.empty((0, 4))
+
+    assert sample_points(dask_image, points).shape == (0,)
+    results = neighbourhood_statistics(
+        dask_image, points, RADIUS, background_radius=BACKGROUND_RADIUS
+    )
+    assert set(results) == set(STATISTICS)
+    assert all(values.shape == (0,) for values in results.values())
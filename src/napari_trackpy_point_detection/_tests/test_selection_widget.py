@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from napari_trackpy_point_detection.utilities.selection_widget import (
+    SelectionWidget,
+)
+
+DETECTIONS = pd.DataFrame(
+    {
+        "y": [2.0, 8.0, 15.0, 4.0],
+        "x": [2.0, 8.0, 15.0, 9.0],
+        "mass": [100.0, 400.0, 250.0, 900.0],
+        "size": [1.5, 2.0, 2.5, 3.0],
+    }
+)
+
+
+@pytest.fixture
+def selection(make_napari_viewer):
+    """A selection widget with sliders for the detections in an image."""
+
+    viewer = make_napari_viewer()
+    image = viewer.add_image(np.zeros((20, 20)), name="image")
+
+    widget = SelectionWidget(viewer)
+    widget._start_detection(image)
+    widget._update_points_and_sliders(DETECTIONS, image)
+
+    return widget
+
+
+def filter_mass(widget, low, high):
+    slider = next(s for s in widget.sliders if s.name == "mass")
+    slider.range_slider.setValue((low, high))
+    widget._filter_objects.flush()
+
+
+def test_filtering_hides_points_without_removing_them(selection):
+    filter_mass(selection, 200, 500)
+
+    assert len(selection.points.data) == 4
+    assert list(selection.points.shown) == [False, True, True, False]
+    assert list(selection.filtered_df.index) == [1, 2]
+
+
+def test_confirming_keeps_the_shown_points(selection):
+    filter_mass(selection, 200, 500)
+
+    selection._confirm_points()
+
+    np.testing.assert_array_equal(
+        selection.points.data, DETECTIONS.loc[[1, 2], ["y", "x"]].to_numpy()
+    )
+    assert selection.points.shown.all()
+
+
+def test_sliders_count_the_points_in_range(selection):
+    slider = next(s for s in selection.sliders if s.name == "mass")
+    assert slider.count_label.text() == "4 of 4 points in range"
+
+    filter_mass(selection, 200, 500)
+    assert slider.count_label.text() == "2 of 4 points in range"
+
+
+def test_sliders_at_their_full_range_keep_points_without_a_value(
+    make_napari_viewer,
+):
+    viewer = make_napari_viewer()
+    image = viewer.add_image(np.zeros((20, 20)), name="image")
+    detections = DETECTIONS.copy()
+    detections.loc[2, "size"] = np.nan
+
+    widget = SelectionWidget(viewer)
+    widget._start_detection(image)
+    widget._update_points_and_sliders(detections, image)
+
+    # moving a slider and back to its full range does not drop them either
+    filter_mass(widget, 200, 500)
+    slider = next(s for s in widget.sliders if s.name == "mass")
+    qslider = slider.range_slider._slider
+    filter_mass(widget, qslider.minimum(), qslider.maximum())
+    widget._confirm_points()
+
+    assert len(widget.points.data) == 4
+
+
+def test_points_streamed_in_during_detection_can_be_filtered_and_confirmed(
+    make_napari_viewer,
+):
+    viewer = make_napari_viewer()
+    image = viewer.add_image(np.zeros((20, 20)), name="image")
+
+    widget = SelectionWidget(viewer)
+    widget._start_detection(image)
+    # one batch of points per frame, as they are detected (trackpy gives frames
+    # without points object columns)
+    widget._add_points(DETECTIONS.iloc[:1])
+    widget._add_points(DETECTIONS.iloc[1:2])
+    widget._add_points(DETECTIONS.iloc[:0].astype(object))
+    widget._add_points(DETECTIONS.iloc[2:])
+    # the first frame is shown right away, the others together a little later
+    assert len(widget.points.data) == 1
+    widget._show_detected_points.flush()
+    assert len(widget.points.data) == 4
+    assert widget.points.data.dtype == float
+    assert not widget.points.selected_data
+
+    widget._update_points_and_sliders(DETECTIONS, image)
+    filter_mass(widget, 200, 500)
+    widget._confirm_points()
+
+    np.testing.assert_array_equal(
+        widget.points.data, DETECTIONS.loc[[1, 2], ["y", "x"]].to_numpy()
+    )
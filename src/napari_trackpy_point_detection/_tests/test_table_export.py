@@ -0,0 +1,68 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from napari_trackpy_point_detection.utilities.table_export import (
+    export_format,
+    iter_export,
+)
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.uniform(0, 100, size=(250, 3)), columns=["z", "y", "x"])
+    df["mass"] = rng.integers(0, 1000, size=250)
+    df.loc[3, "y"] = np.nan
+    # rows in another order than the index, as in a sorted table
+    return df.sort_values("mass")
+
+
+@pytest.mark.parametrize("fmt", ["csv", "csv.gz", "parquet", "feather"])
+def test_export_writes_all_chunks(points, tmp_path, fmt):
+    if fmt in ("parquet", "feather"):
+        pytest.importorskip("pyarrow")
+    path = tmp_path / f"points.{fmt}"
+
+    assert list(iter_export(points, path, chunk_size=100)) == [100, 200, 250]
+
+    if fmt.startswith("csv"):
+        # the index is kept, as in pandas' to_csv
+        pd.testing.assert_frame_equal(pd.read_csv(path, index_col=0), points)
+    else:
+        read = pd.read_parquet if fmt == "parquet" else pd.read_feather
+        pd.testing.assert_frame_equal(read(path), points.reset_index(drop=True))
+
+
+@pytest.mark.parametrize("fmt", ["csv", "csv.gz"])
+def test_csv_header_matches_pandas(points, tmp_path, fmt):
+    points = points.rename(columns={"x": "x, px"})
+    path = tmp_path / f"points.{fmt}"
+
+    list(iter_export(points, path, chunk_size=100))
+
+    with (gzip.open if fmt == "csv.gz" else open)(path, "rt") as f:
+        header = f.readline()
+    assert header == points.iloc[:0].to_csv()
+    pd.testing.assert_frame_equal(pd.read_csv(path, index_col=0), points)
+
+
+def test_cancelled_export_leaves_no_file(points, tmp_path):
+    path = tmp_path / "points.csv"
+    path.write_text("previous")
+
+    rows_written = iter_export(points, path, chunk_size=100)
+    next(rows_written)
+    rows_written.close()
+
+    assert path.read_text() == "previous"
+    assert [p.name for p in tmp_path.iterdir()] == ["points.csv"]
+
+
+def test_export_format_follows_the_extension():
+    assert export_format("points.CSV") == "csv"
+    assert export_format("points.csv.gz") == "csv.gz"
+    with pytest.raises(ValueError, match=".parquet"):
+        export_format("points.txt")
@@ -0,0 +1,143 @@
+import argparse
+from dataclasses import fields
+from pathlib import Path
+
+import dask.array as da
+import numpy as np
+import pandas as pd
+
+from .utilities.detection import DetectionParameters, detect, squeeze
+from .utilities.result_store import ResultStore, iter_detect_stored
+
+
+def read_image(path: Path, component: str | None = None) -> np.ndarray:
+    """Read a TIFF, Zarr or NumPy (.npy) image. The images are opened lazily (TIFF and
+    Zarr as dask array, NumPy as memory map), so that only the frame being processed
+    has to be in memory."""
+
+    suffix = path.suffix.lower()
+    if suffix in (".tif", ".tiff"):
+        try:
+            import tifffile
+            import zarr
+        except ImportError as e:
+            raise ImportError(
+                "Reading TIFF files requires tifffile and zarr: "
+                "pip install tifffile zarr"
+            ) from e
+        # the pages of the (full resolution) image, read as they are needed
+        store = tifffile.imread(path, aszarr=True, level=0)
+        return da.from_zarr(zarr.open(store, mode="r"))
+
+    if suffix == ".zarr":
+        return da.from_zarr(str(path), component=component)
+
+    if suffix == ".npy":
+        return np.load(path, mmap_mode="r")
+
+    raise ValueError(
+        f"Cannot read '{path}': expected a .tif(f), .zarr or .npy file"
+    )
+
+
+def write_table(df: pd.DataFrame, path: Path) -> None:
+    """Write the detections to a Parquet or CSV file, depending on its extension"""
+
+    suffix = path.suffix.lower()
+    if suffix == ".parquet":
+        df.to_parquet(path, index=False)
+    elif suffix == ".csv":
+        df.to_csv(path, index=False)
+    else:
+        raise ValueError(
+            f"Cannot write '{path}': expected a .parquet or .csv file"
+        )
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """Parse the command line arguments, with the defaults of DetectionParameters"""
+
+    defaults = DetectionParameters()
+    parser = argparse.ArgumentParser(
+        prog="napari-trackpy-detect",
+        description="Detect objects in a 2D, 2D + time, 3D, or 3D + time image "
+        "with trackpy, without opening napari.",
+    )
+    parser.add_argument("image", type=Path, help=".tif(f), .zarr or .npy image")
+    parser.add_argument("output", type=Path, help=".parquet or .csv table")
+    parser.add_argument(
+        "--component",
+        help="path of the array within a .zarr group, e.g. '0' for the first level "
+        "of an OME-Zarr image",
+    )
+    parser.add_argument(
+        "--use-z",
+        action="store_true",
+        help="treat the first axis of a 3D image as z instead of time",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        help="directory in which to store the detections per image and settings, "
+        "to load them from when detecting again with the same settings (or to "
+        "resume an interrupted run from)",
+    )
+
+    help_texts = {
+        "diameter_xy": "object diameter in xy (odd number, pixels)",
+        "diameter_z": "object diameter in z (odd number, pixels)",
+        "separation_xy": "object separation in xy (pixels)",
+        "separation_z": "object separation in z (pixels)",
+        "percentile": "intensity percentile threshold",
+        "downsample_xy": "downsampling factor in xy, 1 to not downsample",
+        "downsample_z": "downsampling factor in z, 1 to not downsample",
+        "sigma_xy": "gaussian blur sigma in xy, 1 to not blur",
+        "sigma_z": "gaussian blur sigma in z, 1 to not blur",
+        "n_workers": "number of worker processes over which time points (or tiles) "
+        "are divided",
+        "tile_size": "process the image in overlapping tiles of this size (pixels), "
+        "0 to process whole images",
+    }
+    for field in fields(DetectionParameters):
+        if field.name in help_texts:
+            default = getattr(defaults, field.name)
+            parser.add_argument(
+                f"--{field.name.replace('_', '-')}",
+                dest=field.name,
+                type=type(default),
+                default=default,
+                help=f"{help_texts[field.name]} (default: {default})",
+            )
+
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Entry point of the napari-trackpy-detect command"""
+
+    args = parse_args(argv)
+    params = DetectionParameters(
+        **{
+            field.name: getattr(args, field.name)
+            for field in fields(DetectionParameters)
+        }
+    )
+
+    img = squeeze(read_image(args.image, args.component))
+    if args.store is None:
+        df = detect(img, params)
+    else:
+        source = args.image.resolve()
+        if args.component is not None:
+            source = source / args.component
+        frames = iter_detect_stored(
+            img, params, ResultStore(args.store), str(source)
+        )
+        df = pd.concat(list(frames), ignore_index=True)
+    write_table(df, args.output)
+
+    print(f"Detected {len(df)} objects, saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
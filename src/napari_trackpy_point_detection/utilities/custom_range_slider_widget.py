@@ -1,12 +1,58 @@
+import numpy as np
 import pandas as pd
 from qtpy import QtCore
+from qtpy.QtGui import QColor, QPainter
 from qtpy.QtWidgets import QLabel, QVBoxLayout, QWidget
 from superqt import QLabeledDoubleRangeSlider, QLabeledRangeSlider
 
 
+class HistogramWidget(QWidget):
+    """Bar plot of a histogram, in which the bins within a range are highlighted"""
+
+    def __init__(self, counts: np.ndarray, edges: np.ndarray):
+        super().__init__()
+
+        # log scale, so that the sparse tails of e.g. brightness remain visible
+        heights = np.log1p(counts)
+        self._heights = heights / heights.max() if heights.max() > 0 else heights
+        self._edges = edges
+        self._range = (edges[0], edges[-1])
+
+        self.setMinimumHeight(40)
+
+    def set_range(self, low: float, high: float) -> None:
+        """Highlight the bins within [low, high]"""
+
+        self._range = (low, high)
+        self.update()
+
+    def paintEvent(self, event) -> None:
+        painter = QPainter(self)
+        width, height = self.width(), self.height()
+        span = self._edges[-1] - self._edges[0]
+        if span <= 0:
+            return
+
+        x = (self._edges - self._edges[0]) / span * width
+        centers = (self._edges[:-1] + self._edges[1:]) / 2
+        in_range = (centers >= self._range[0]) & (centers <= self._range[1])
+        for left, right, bar_height, selected in zip(
+            x[:-1], x[1:], self._heights * height, in_range, strict=False
+        ):
+            color = QColor(0, 200, 255) if selected else QColor(90, 90, 90)
+            painter.fillRect(
+                QtCore.QRectF(left, height - bar_height, right - left, bar_height),
+                color,
+            )
+
+
 class CustomRangeSliderWidget(QWidget):
     """implements superqt RangeSlider widget to select a range of values based on a pandas dataframe"""
 
+    # number of histogram bars, and the number of bins each bar is counted in
+    n_bins = 100
+    bin_subdivisions = 40
+
     def __init__(
         self,
         df: pd.DataFrame,
@@ -48,7 +94,47 @@ class CustomRangeSliderWidget(QWidget):
         self.label.setToolTip(tip)
         self.label.setToolTipDuration(1000)
 
+        # Distribution of the values, computed once: the number of points in range is
+        # read from its cumulative sum while the slider moves. It is counted in much
+        # finer bins than are shown, to keep the counts close to exact.
+        values = df[name].to_numpy(dtype=float, na_value=np.nan)
+        self.n_points = len(values)
+        counts, self._edges = np.histogram(
+            values[np.isfinite(values)],
+            bins=self.n_bins * self.bin_subdivisions,
+            range=(self.range_slider.minimum(), self.range_slider.maximum()),
+        )
+        self._cumulative_counts = np.concatenate([[0], np.cumsum(counts)])
+
+        self.histogram = HistogramWidget(
+            counts.reshape(self.n_bins, -1).sum(axis=1),
+            self._edges[:: self.bin_subdivisions],
+        )
+        self.count_label = QLabel()
+        self.range_slider.valueChanged.connect(self._update_range)
+
         slider_layout.addWidget(self.label)
+        slider_layout.addWidget(self.histogram)
         slider_layout.addWidget(self.range_slider)
+        slider_layout.addWidget(self.count_label)
 
         self.setLayout(slider_layout)
+        self._update_range(self.range_slider.value())
+
+    def count_in_range(self, low: float, high: float) -> int:
+        """Number of points with a value within [low, high], from the cumulative
+        histogram (interpolated within the bins that contain low and high)"""
+
+        below_high, below_low = np.interp(
+            [high, low], self._edges, self._cumulative_counts
+        )
+        return int(round(below_high - below_low))
+
+    def _update_range(self, value: tuple[float, float]) -> None:
+        """Show which part of the distribution, and how many points, are in range"""
+
+        low, high = value
+        self.histogram.set_range(low, high)
+        self.count_label.setText(
+            f"{self.count_in_range(low, high)} of {self.n_points} points in range"
+        )
@@ -0,0 +1,113 @@
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class Deletion:
+    """The points removed by one deletion, with what is needed to put them back.
+
+    Deleting points changes no other cells (the remaining rows only move up), so only
+    the deleted points and rows are kept, rather than a copy of the whole table.
+    """
+
+    indices: np.ndarray  # positions of the points in the layer, increasing
+    points: np.ndarray  # their layer data
+    rows: np.ndarray  # positions of their rows in the table, increasing
+    table_rows: pd.DataFrame  # their rows, in table order, labelled by layer index
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.indices.nbytes
+            + self.points.nbytes
+            + self.rows.nbytes
+            + int(self.table_rows.memory_usage(deep=True).sum())
+        )
+
+
+class DeletionHistory:
+    """Undo and redo stacks of deletions, which together take up at most max_bytes.
+    The oldest deletions are forgotten first when the limit is reached."""
+
+    def __init__(self, max_bytes: int = 512 * 1024**2):
+        self.max_bytes = max_bytes
+        self._undo = deque()
+        self._redo = []
+        self._nbytes = 0
+
+    @property
+    def can_undo(self) -> bool:
+        return len(self._undo) > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return len(self._redo) > 0
+
+    def push(self, deletion: Deletion) -> None:
+        """Add a new deletion, which makes the undone deletions impossible to redo"""
+
+        for undone in self._redo:
+            self._nbytes -= undone.nbytes
+        self._redo = []
+        self._push_undo(deletion)
+
+    def undo(self) -> Deletion:
+        """Return the last deletion, to restore its points"""
+
+        deletion = self._undo.pop()
+        self._redo.append(deletion)
+        return deletion
+
+    def redo(self) -> Deletion:
+        """Return the last undone deletion, to delete its points again"""
+
+        deletion = self._redo.pop()
+        self._nbytes -= deletion.nbytes
+        self._push_undo(deletion)
+        return deletion
+
+    def clear(self) -> None:
+        self._undo.clear()
+        self._redo = []
+        self._nbytes = 0
+
+    def _push_undo(self, deletion: Deletion) -> None:
+        self._undo.append(deletion)
+        self._nbytes += deletion.nbytes
+        while self._nbytes > self.max_bytes and self._undo:
+            self._nbytes -= self._undo.popleft().nbytes
+
+
+def restore_points(data: np.ndarray, deletion: Deletion) -> np.ndarray:
+    """Return the layer data with the deleted points back at their positions"""
+
+    n_points = len(data) + len(deletion.indices)
+    deleted = np.zeros(n_points, dtype=bool)
+    deleted[deletion.indices] = True
+
+    restored = np.empty((n_points, data.shape[1]), dtype=data.dtype)
+    restored[deleted] = deletion.points
+    restored[~deleted] = data
+    return restored
+
+
+def restore_rows(df: pd.DataFrame, deletion: Deletion) -> pd.DataFrame:
+    """Return the table with the deleted rows back at their positions, and the labels
+    of the other rows moved back down past the restored points"""
+
+    n_points = len(df) + len(deletion.indices)
+    deleted = np.zeros(n_points, dtype=bool)
+    deleted[deletion.indices] = True
+    kept = np.flatnonzero(~deleted)
+    df = df.set_axis(kept[df.index.to_numpy()])
+
+    # the current rows first, then the restored rows, taken in table order
+    deleted_row = np.zeros(n_points, dtype=bool)
+    deleted_row[deletion.rows] = True
+    order = np.empty(n_points, dtype=int)
+    order[~deleted_row] = np.arange(len(df))
+    order[deleted_row] = np.arange(len(df), n_points)
+    return pd.concat([df, deletion.table_rows]).take(order)
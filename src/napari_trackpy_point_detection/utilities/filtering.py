@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+
+class RangeFilter:
+    """Selects the rows of a dataframe whose properties all lie within a range.
+
+    Each property is sorted once, after which a range resolves to a slice of the
+    sorted rows with searchsorted. Per row, the number of properties whose range
+    excludes it is kept up to date: changing one range only touches the rows that
+    enter or leave it, rather than comparing every row against every range again.
+    """
+
+    def __init__(self, df: pd.DataFrame, properties: list[str]):
+        self.n_rows = len(df)
+        self._order = {}
+        self._sorted = {}
+        self._bounds = {}
+        for prop in properties:
+            # NaN is sorted last, so that it falls outside any range that is set (but
+            # not when the range is cleared)
+            values = df[prop].to_numpy(dtype=float, na_value=np.nan)
+            order = np.argsort(values, kind="stable")
+            self._order[prop] = order
+            self._sorted[prop] = values[order]
+            self._bounds[prop] = (0, self.n_rows)
+
+        # number of ranges that exclude each row
+        self._n_excluded = np.zeros(self.n_rows, dtype=np.uint8)
+
+    @property
+    def mask(self) -> np.ndarray:
+        """Boolean array, True for the rows within all ranges"""
+
+        return self._n_excluded == 0
+
+    def set_range(self, prop: str, low: float, high: float) -> None:
+        """Only keep the rows whose value of prop lies within [low, high]"""
+
+        self._set_bounds(prop, *self._range_bounds(prop, low, high))
+
+    def clear_range(self, prop: str) -> None:
+        """Keep all rows as far as prop is concerned, including those without a value"""
+
+        self._set_bounds(prop, 0, self.n_rows)
+
+    def _set_bounds(self, prop: str, start: int, stop: int) -> None:
+        """Keep the rows from start to stop in the sorted values of prop"""
+
+        order = self._order[prop]
+        old_start, old_stop = self._bounds[prop]
+
+        # only the rows between the old and new bounds enter or leave the range
+        if start < old_start:
+            self._n_excluded[order[start:old_start]] -= 1
+        elif start > old_start:
+            self._n_excluded[order[old_start:start]] += 1
+        if stop > old_stop:
+            self._n_excluded[order[old_stop:stop]] -= 1
+        elif stop < old_stop:
+            self._n_excluded[order[stop:old_stop]] += 1
+
+        self._bounds[prop] = (start, stop)
+
+    def _range_bounds(
+        self, prop: str, low: float, high: float
+    ) -> tuple[int, int]:
+        """Positions in the sorted values of prop that delimit [low, high]"""
+
+        sorted_values = self._sorted[prop]
+        start = int(np.searchsorted(sorted_values, low, side="left"))
+        stop = int(np.searchsorted(sorted_values, high, side="right"))
+        return start, max(start, stop)
@@ -0,0 +1,151 @@
+import hashlib
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from pathlib import Path
+
+import numpy as np
+
+
+class FrameCache:
+    """Least-recently-used cache of preprocessed (downsampled and blurred) frames.
+
+    The frames in memory take up at most max_bytes. With spill_to_disk, frames that no
+    longer fit in memory are moved to a temporary directory (of at most
+    max_disk_bytes) instead of being dropped, which is usually still much faster than
+    loading and preprocessing them again. The cache can be used from multiple threads.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 2 * 1024**3,
+        spill_to_disk: bool = False,
+        max_disk_bytes: int = 20 * 1024**3,
+    ):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+        self._disk: OrderedDict[Hashable, tuple[Path, int]] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._spill_dir = None
+        self._lock = threading.Lock()
+
+        self.spill_to_disk = spill_to_disk
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes taken up by the frames in memory"""
+
+        return self._memory_bytes
+
+    @property
+    def spill_to_disk(self) -> bool:
+        """Whether frames that do not fit in memory are moved to disk"""
+
+        return self._spill_dir is not None
+
+    @spill_to_disk.setter
+    def spill_to_disk(self, spill: bool) -> None:
+        with self._lock:
+            if spill and self._spill_dir is None:
+                self._spill_dir = Path(
+                    tempfile.mkdtemp(prefix="trackpy-frame-cache-")
+                )
+            elif not spill and self._spill_dir is not None:
+                self._clear_disk()
+
+    def get(self, key: Hashable) -> np.ndarray | None:
+        """Return the frame stored under key, or None if it is not in the cache"""
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+            if key not in self._disk:
+                return None
+
+            path, _ = self._disk.pop(key)
+            frame = np.load(path)
+            path.unlink(missing_ok=True)
+            self._disk_bytes -= frame.nbytes
+
+        # move the frame back to memory, as it is being used again
+        self.put(key, frame)
+        return frame
+
+    def put(self, key: Hashable, frame: np.ndarray) -> None:
+        """Store frame under key. The frame should not be modified afterwards."""
+
+        if frame.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= self._memory.pop(key).nbytes
+            self._memory[key] = frame
+            self._memory_bytes += frame.nbytes
+            self._evict()
+
+    def resize(self, max_bytes: int) -> None:
+        """Change the memory limit, dropping (or spilling) frames that no longer fit"""
+
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self) -> None:
+        """Remove all frames, from memory and from disk"""
+
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._spill_dir is not None:
+                self._clear_disk()
+                self._spill_dir = Path(
+                    tempfile.mkdtemp(prefix="trackpy-frame-cache-")
+                )
+
+    def _evict(self) -> None:
+        """Drop (or spill) the least recently used frames until the frames in memory
+        fit within max_bytes. Must be called with the lock held."""
+
+        while self._memory_bytes > self.max_bytes:
+            key, frame = self._memory.popitem(last=False)
+            self._memory_bytes -= frame.nbytes
+            if self._spill_dir is not None:
+                self._spill(key, frame)
+
+    def _spill(self, key: Hashable, frame: np.ndarray) -> None:
+        """Write an evicted frame to disk, evicting the oldest spilled frames to stay
+        within max_disk_bytes. Must be called with the lock held."""
+
+        if frame.nbytes > self.max_disk_bytes:
+            return
+
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        path = self._spill_dir / f"{name}.npy"
+        np.save(path, frame)
+        self._disk[key] = (path, frame.nbytes)
+        self._disk_bytes += frame.nbytes
+
+        while self._disk_bytes > self.max_disk_bytes:
+            _, (old_path, nbytes) = self._disk.popitem(last=False)
+            old_path.unlink(missing_ok=True)
+            self._disk_bytes -= nbytes
+
+    def _clear_disk(self) -> None:
+        """Remove the spilled frames and their directory. Must be called with the lock
+        held."""
+
+        shutil.rmtree(self._spill_dir, ignore_errors=True)
+        self._spill_dir = None
+        self._disk.clear()
+        self._disk_bytes = 0
+
+    def __del__(self):
+        if getattr(self, "_spill_dir", None) is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
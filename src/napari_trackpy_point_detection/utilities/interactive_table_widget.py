@@ -1,46 +1,95 @@
-
-import copy
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
 
 import napari
 import numpy as np
 import pandas as pd
-from matplotlib.colors import to_rgba
+from napari.qt.threading import thread_worker
 from napari.utils import CyclicLabelColormap, DirectLabelColormap
+from napari.utils.notifications import show_error, show_warning
 from qtpy.QtCore import (
+    QAbstractTableModel,
     QEvent,
     QItemSelection,
     QItemSelectionModel,
+    QMimeData,
     QModelIndex,
     QObject,
     QSignalBlocker,
     Qt,
+    QUrl,
 )
-from qtpy.QtGui import QColor, QPen
+from qtpy.QtGui import QBrush, QColor, QPen
 from qtpy.QtWidgets import (
     QAbstractItemView,
+    QApplication,
     QFileDialog,
     QHBoxLayout,
     QLabel,
+    QProgressDialog,
     QPushButton,
     QStyle,
     QStyledItemDelegate,
     QStyleOptionViewItem,
-    QTableWidget,
-    QTableWidgetItem,
+    QTableView,
     QVBoxLayout,
     QWidget,
 )
 
+from .deletion_history import (
+    Deletion,
+    DeletionHistory,
+    restore_points,
+    restore_rows,
+)
+from .profiling import stage
+from .table_export import EXPORT_FORMATS, export_format, iter_export
+
+
+class FloatDelegate(QStyledItemDelegate):
+    def __init__(self, decimals, parent=None):
+        super().__init__(parent)
+        self.nDecimals = decimals
 
-class NoSelectionHighlightDelegate(QStyledItemDelegate):
+    def displayText(self, value, locale):
+        try:
+            number = float(value)
+        except (ValueError, TypeError):
+            return str(value)
+
+        if number.is_integer():
+            return str(int(number))
+        return f"{number:.{self.nDecimals}f}"
+
+
+class NoSelectionHighlightDelegate(FloatDelegate):
     """Prevents Qt from painting the default selection background,
-    preserving each row's custom background color, and draws a cyan border instead."""
+    preserving each row's custom background color, and draws a cyan border instead.
+    Numbers are shown with ``decimals`` decimals."""
+
+    def __init__(self, table: QTableView, decimals: int = 3):
+        super().__init__(decimals, table)
+
+        # The selected rows are looked up for every painted cell, so they are only read
+        # from the selection when it changes.
+        self._selected_rows = set()
+        table.selectionModel().selectionChanged.connect(
+            self._selection_changed
+        )
+
+    def set_selected_rows(self, rows: np.ndarray) -> None:
+        """Set the selected rows, for selections made with the signals blocked"""
+
+        self._selected_rows = set(rows.tolist())
+
+    def _selection_changed(self, _selected, _deselected):
+        selection = self.parent().selectionModel().selection()
+        self.set_selected_rows(_selection_rows(selection))
 
     def paint(self, painter, option, index):
         opt = QStyleOptionViewItem(option)
 
-        table = index.model().parent()
-
         if opt.state & QStyle.State_Selected:
             opt.state &= ~QStyle.State_Selected
 
@@ -48,7 +97,7 @@ class NoSelectionHighlightDelegate(QStyledItemDelegate):
         super().paint(painter, opt, index)
 
         # Draw a cyan border around the *entire row* if selected
-        if index.row() in {i.row() for i in table.selectedIndexes()}:
+        if index.row() in self._selected_rows:
             pen = QPen(Qt.cyan, 2)
             painter.setPen(pen)
             painter.drawRect(opt.rect.adjusted(1, 1, -2, -2))
@@ -78,23 +127,152 @@ class ClickToSingleSelectFilter(QObject):
         return False
 
 
-class FloatDelegate(QStyledItemDelegate):
-    def __init__(self, decimals, parent=None):
+class PointsTableModel(QAbstractTableModel):
+    """Read-only table model over a pandas dataframe.
+
+    Cells are read from the dataframe columns when the view asks for them, which it
+    only does for the visible rows, so (re)setting the dataframe costs the same for a
+    hundred points as for a million.
+    """
+
+    # removing more separate ranges of rows than this resets the model instead, which
+    # is cheaper than letting the view process each removal
+    max_removed_ranges = 64
+
+    def __init__(self, parent=None):
         super().__init__(parent)
-        self.nDecimals = decimals
 
-    def displayText(self, value, locale):
-        try:
-            number = float(value)
-        except (ValueError, TypeError):
-            return str(value)
+        self._df = pd.DataFrame()
+        self._columns = []
+        self._n_rows = 0
+        self._row_colors = None
 
-        if number.is_integer():
-            return str(int(number))
-        return f"{number:.{self.nDecimals}f}"
+    def set_dataframe(
+        self, df: pd.DataFrame, row_colors: np.ndarray | None = None
+    ) -> None:
+        """Show df, with optional colors per row: an (n, 8) uint8 array with the RGBA
+        background and RGBA text color of each row. Rows with a transparent background
+        keep the default colors."""
 
+        self.beginResetModel()
+        self._set_dataframe(df)
+        self._row_colors = row_colors
+        self.endResetModel()
+
+    def append_rows(
+        self, df: pd.DataFrame, row_colors: np.ndarray | None = None
+    ) -> None:
+        """Show df, which has rows appended to the dataframe shown so far"""
 
-class CustomTableWidget(QTableWidget):
+        count = len(df) - self._n_rows
+        if count <= 0:
+            return
+
+        self.beginInsertRows(QModelIndex(), self._n_rows, len(df) - 1)
+        self._set_dataframe(df)
+        if self._row_colors is not None:
+            if row_colors is None:
+                row_colors = np.zeros((count, 8), dtype=np.uint8)
+            self._row_colors = np.concatenate([self._row_colors, row_colors])
+        self.endInsertRows()
+
+    def remove_rows(self, rows: np.ndarray, df: pd.DataFrame) -> None:
+        """Show df, which is the dataframe shown so far without rows"""
+
+        rows = np.unique(rows)
+        if len(rows) == 0:
+            return
+
+        # split the rows into ranges of consecutive rows, removed from the bottom up so
+        # that the rows of the next range do not shift
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        ranges = list(
+            zip(rows[np.r_[0, breaks]], rows[np.r_[breaks - 1, -1]], strict=True)
+        )
+        if len(ranges) > self.max_removed_ranges:
+            colors = self._row_colors
+            if colors is not None:
+                colors = np.delete(colors, rows, axis=0)
+            self.set_dataframe(df, colors)
+            return
+
+        for first, last in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), int(first), int(last))
+            self._n_rows -= last - first + 1
+            self.endRemoveRows()
+
+        self._set_dataframe(df)
+        if self._row_colors is not None:
+            self._row_colors = np.delete(self._row_colors, rows, axis=0)
+
+    def update_rows(
+        self,
+        rows: np.ndarray,
+        df: pd.DataFrame,
+        row_colors: np.ndarray | None = None,
+    ) -> None:
+        """Show df, in which the values of rows have changed"""
+
+        rows = np.asarray(rows, dtype=int)
+        if len(rows) == 0:
+            return
+
+        self._set_dataframe(df)
+        if self._row_colors is not None:
+            self._row_colors[rows] = 0 if row_colors is None else row_colors
+
+        self.dataChanged.emit(
+            self.index(int(rows.min()), 0),
+            self.index(int(rows.max()), len(self._columns) - 1),
+        )
+
+    def _set_dataframe(self, df: pd.DataFrame) -> None:
+        """Read the columns of df, without notifying the view"""
+
+        self._df = df
+        self._columns = [df[column].to_numpy() for column in df.columns]
+        self._n_rows = len(df)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._n_rows
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._columns)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        if role == Qt.DisplayRole:
+            value = self._columns[index.column()][index.row()]
+            return value.item() if isinstance(value, np.generic) else value
+
+        if (
+            role in (Qt.BackgroundRole, Qt.ForegroundRole)
+            and self._row_colors is not None
+        ):
+            colors = self._row_colors[index.row()]
+            if colors[3] == 0:
+                return None
+            red, green, blue, alpha = (
+                colors[:4] if role == Qt.BackgroundRole else colors[4:]
+            ).tolist()
+            return QBrush(QColor(red, green, blue, alpha))
+
+        return None
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return str(self._df.columns[section])
+        return section + 1
+
+    def flags(self, index: QModelIndex):
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+
+class CustomTableView(QTableView):
     def mousePressEvent(self, event):
         index = self.indexAt(event.pos())
         if index.isValid():
@@ -111,6 +289,15 @@ class CustomTableWidget(QTableWidget):
 class InteractiveTableWidget(QWidget):
     """Customized table widget"""
 
+    # changes to more cells than this replace the changed columns as a whole
+    max_updated_cells = 10_000
+    # copying more rows than this saves them to a temporary file instead, which is
+    # copied to the clipboard as file
+    max_clipboard_rows = 100_000
+
+    # the deletions that can be undone or redone take up at most this many bytes
+    max_undo_bytes = 512 * 1024**2
+
     def __init__(
         self, layer: "napari.layers.Points", viewer: "napari.Viewer" = None
     ):
@@ -119,8 +306,10 @@ class InteractiveTableWidget(QWidget):
         self._layer = layer
         self._viewer = viewer
         self.df = pd.DataFrame()
-        self.undo_df = pd.DataFrame()
-        self._table_widget = CustomTableWidget()
+        self.history = DeletionHistory(self.max_undo_bytes)
+        self._table_widget = CustomTableView()
+        self._model = PointsTableModel(self._table_widget)
+        self._table_widget.setModel(self._model)
         self._table_widget.selectionModel().selectionChanged.connect(
             self._selection_changed
         )
@@ -128,6 +317,15 @@ class InteractiveTableWidget(QWidget):
         self._deleting_points = False
         self._selection_connected = False
         self._region_colormap = None  # colors the rows by region, if measured
+        # colormap, and the labels mapped with it and their colors (sorted by label)
+        self._region_color_cache = (None, None, None)
+        # the table being saved, if any
+        self._export = None
+        self._export_worker = None
+        self._export_progress = None
+        self._copied_file = None  # temporary file being saved for the clipboard
+        self._copy_worker = None
+        self._highlight_delegate = None  # created once the table is set up
 
         # Created before the first ``_set_data`` call, which keeps it up to date.
         self.point_count_label = QLabel()
@@ -156,7 +354,7 @@ class InteractiveTableWidget(QWidget):
         copy_button = QPushButton("Copy to clipboard")
         copy_button.clicked.connect(self._copy_table)
 
-        save_button = QPushButton("Save as csv")
+        save_button = QPushButton("Save table")
         save_button.clicked.connect(self._save_table)
 
         button_layout = QHBoxLayout()
@@ -169,8 +367,12 @@ class InteractiveTableWidget(QWidget):
         self.undo_button = QPushButton("Undo")
         self.undo_button.setEnabled(False)
         self.undo_button.clicked.connect(self._undo_delete_points)
+        self.redo_button = QPushButton("Redo")
+        self.redo_button.setEnabled(False)
+        self.redo_button.clicked.connect(self._redo_delete_points)
         delete_undo_layout.addWidget(delete_button)
         delete_undo_layout.addWidget(self.undo_button)
+        delete_undo_layout.addWidget(self.redo_button)
 
         main_layout = QVBoxLayout()
         main_layout.addLayout(button_layout)
@@ -183,7 +385,7 @@ class InteractiveTableWidget(QWidget):
 
         # Selection behavior
         self._table_widget.setStyleSheet("""
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 border: 2px solid cyan;
             }
         """)
@@ -215,8 +417,10 @@ class InteractiveTableWidget(QWidget):
         self._click_filter = ClickToSingleSelectFilter(self._table_widget)
         self._table_widget.viewport().installEventFilter(self._click_filter)
 
-        delegate = NoSelectionHighlightDelegate(self._table_widget)
-        self._table_widget.setItemDelegate(delegate)
+        self._highlight_delegate = NoSelectionHighlightDelegate(
+            self._table_widget
+        )
+        self._table_widget.setItemDelegate(self._highlight_delegate)
 
     def refresh(self):
 
@@ -233,16 +437,15 @@ class InteractiveTableWidget(QWidget):
             self._selection_connected = True
 
     def _selection_changed(self, _selected, _deselected):
-        rows = [
-            index.row()
-            for index in self._table_widget.selectionModel().selectedRows()
-        ]
+        # the rows are labelled with the index of their point in the layer
+        rows = self._selected_table_rows()
+        indices = self.df.index.to_numpy()[rows] if len(self.df) else rows
         # Guard so the resulting layer ``selected_data`` change does not bounce back into
         # ``_update_selection`` (which clears + reselects the table). During a drag on the
         # row index that clearing resets the drag anchor and undoes the range selection.
         self._updating_selection = True
         try:
-            self._layer.selected_data = rows
+            self._layer.selected_data = indices.tolist()
         finally:
             self._updating_selection = False
 
@@ -256,43 +459,16 @@ class InteractiveTableWidget(QWidget):
         if self._layer is None:
             return
 
-        if column_index is not None:
-            selected_column = self.df.columns[column_index]
-            self.df = self.df.sort_values(
-                by=selected_column,
-                ascending=self.ascending,
-                ignore_index=False,
-            )
-
-        self._table_widget.clear()
-
-        n_rows, n_cols = self.df.shape
-
-        self._table_widget.setRowCount(n_rows)
-        self._table_widget.setColumnCount(n_cols)
-
-        row_colors = self._region_row_colors()
-
-        for col_idx, column in enumerate(self.df.columns):
-            self._table_widget.setHorizontalHeaderItem(
-                col_idx, QTableWidgetItem(column)
-            )
-
-            for row_idx, value in enumerate(self.df[column]):
-                item = QTableWidgetItem(str(value))
-                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-
-                colors = row_colors[row_idx]
-                if colors is not None:
-                    background, foreground = colors
-                    item.setBackground(background)
-                    item.setForeground(foreground)
-
-                self._table_widget.setItem(row_idx, col_idx, item)
+        with stage("table"):
+            if column_index is not None:
+                selected_column = self.df.columns[column_index]
+                self.df = self.df.sort_values(
+                    by=selected_column,
+                    ascending=self.ascending,
+                    ignore_index=False,
+                )
 
-        self._table_widget.setItemDelegate(
-            FloatDelegate(3, self._table_widget)
-        )
+            self._model.set_dataframe(self.df, self._region_row_colors())
 
     def _update_point_count(self) -> None:
         """Show how many points the table, and with it the layer, is holding."""
@@ -300,39 +476,71 @@ class InteractiveTableWidget(QWidget):
         n_points = 0 if self._layer is None else len(self.df)
         self.point_count_label.setText(f"Number of points: {n_points}")
 
-    def _region_row_colors(self) -> list[tuple[QColor, QColor] | None]:
-        """Return the (background, text) color per row, from the regions colormap.
+    def _region_row_colors(
+        self, rows: np.ndarray | None = None
+    ) -> np.ndarray | None:
+        """Return the background and text color of each row (or only of the given row
+        positions), from the regions colormap, as (n, 8) uint8 RGBA array.
 
-        Rows keep their default colors (None) when no regions were measured, and for
-        points outside any region (label 0, which the colormap maps to transparent).
+        Returns None when no regions were measured. Points outside any region (label
+        0, which the colormap maps to transparent) keep their default colors, which
+        is marked by a transparent background.
         """
 
         if self._region_colormap is None or "region" not in self.df.columns:
-            return [None] * len(self.df)
+            return None
 
-        row_colors = []
-        for label in self.df["region"]:
-            if pd.isna(label):
-                row_colors.append(None)
-                continue
+        labels = self.df["region"].to_numpy(dtype=float, na_value=np.nan)
+        if rows is not None:
+            labels = labels[rows]
 
-            red, green, blue, alpha = to_rgba(
-                np.atleast_2d(self._region_colormap.map(int(label)))[0]
+        row_colors = np.zeros((len(labels), 8), dtype=np.uint8)
+        in_table = ~np.isnan(labels)
+        unique_labels, inverse = np.unique(
+            labels[in_table].astype(int), return_inverse=True
+        )
+        row_colors[in_table] = self._region_colors(unique_labels)[inverse]
+        return row_colors
+
+    def _region_colors(self, labels: np.ndarray) -> np.ndarray:
+        """Return the (background, text) colors of the unique region labels, mapping
+        only the labels that were not mapped before with the current colormap."""
+
+        if self._region_color_cache[0] is not self._region_colormap:
+            self._region_color_cache = (
+                self._region_colormap,
+                np.zeros(0, dtype=int),
+                np.zeros((0, 8), dtype=np.uint8),
             )
-            if alpha == 0:  # not inside any region
-                row_colors.append(None)
-                continue
+        _, cached_labels, cached_colors = self._region_color_cache
+
+        new_labels = labels[~np.isin(labels, cached_labels)]
+        if len(new_labels) > 0:
+            rgba = np.atleast_2d(
+                self._region_colormap.map(new_labels)
+            ).astype(float)
+            colors = np.zeros((len(new_labels), 8), dtype=np.uint8)
+            colors[:, :3] = rgba[:, :3] * 255
+            # labels that the colormap maps to transparent are not inside any region
+            inside = rgba[:, 3] > 0
+            colors[inside, 3] = 255
 
             # Keep the text readable on both light and dark region colors.
-            luminance = 0.299 * red + 0.587 * green + 0.114 * blue
-            row_colors.append(
-                (
-                    QColor(int(red * 255), int(green * 255), int(blue * 255)),
-                    QColor(Qt.black) if luminance > 0.5 else QColor(Qt.white),
-                )
+            luminance = rgba[:, :3] @ [0.299, 0.587, 0.114]
+            colors[inside, 4:7] = np.where(luminance[inside, None] > 0.5, 0, 255)
+            colors[inside, 7] = 255
+
+            cached_labels = np.concatenate([cached_labels, new_labels])
+            cached_colors = np.concatenate([cached_colors, colors])
+            order = np.argsort(cached_labels)
+            cached_labels, cached_colors = cached_labels[order], cached_colors[order]
+            self._region_color_cache = (
+                self._region_colormap,
+                cached_labels,
+                cached_colors,
             )
 
-        return row_colors
+        return cached_colors[np.searchsorted(cached_labels, labels)]
 
     def add_measurements(
         self,
@@ -375,66 +583,118 @@ class InteractiveTableWidget(QWidget):
         return self.df[name].reindex(range(len(self._layer.data))).to_numpy()
 
     def _sync_table_with_layer(self, event):
-        """Synchronize the table when points are added, changed, or removed."""
+        """Synchronize the table when points are added, changed, or removed.
+
+        Only the rows of the affected points are updated, so that e.g. dragging a point
+        stays fast in a large table.
+        """
 
         if self._deleting_points or event.action not in {"removed", "added", "changed"}:
             return
 
+        n_points = len(self._layer.data)
+
         if event.action == "removed":
-            indices = list(event.data_indices)
-            self.df = self.df.drop(index = indices)
-            self.df = self.df.reset_index(drop = True)
+            self._remove_rows(np.asarray(event.data_indices, dtype=int))
             to_select = []
 
         elif event.action == "added":
-            index = self.df.index.max() + 1
-            self.df.loc[index] = np.nan
-            if "z" in self.df.columns:
-                self.df.loc[index, "z"] = self._layer.data[index, -3]
-            if "t" in self.df.columns:
-                self.df.loc[index, "t"] = self._layer.data[index, 0]
-            self.df.loc[index, "y"] = self._layer.data[index, -2]
-            self.df.loc[index, "x"] = self._layer.data[index, -1]
-            to_select = [index]
+            to_select = list(range(len(self.df), n_points))
+            self._append_rows()
 
         elif event.action == "changed":
-            indices = list(event.data_indices)
-            props = {
-                key: np.array(values, copy=True)
-                for key, values in self.df.items()
-            }
+            # setting the layer data as a whole can also change the number of points
+            if n_points < len(self.df):
+                self._remove_rows(np.arange(n_points, len(self.df)))
+            elif n_points > len(self.df):
+                self._append_rows()
 
-            # Update coordinate columns from layer.data
-            props["x"] = self._layer.data[:, -1]
-            props["y"] = self._layer.data[:, -2]
+            indices = np.asarray(event.data_indices, dtype=int)
+            self._update_rows(indices[indices < n_points])
+            to_select = list(indices)
 
-            if "z" in props:
-                props["z"] = self._layer.data[:, -3]
+        self._update_point_count()
+        self._layer.selected_data = to_select
 
-            if "t" in props:
-                props["t"] = self._layer.data[:, 0]
+        # the stored positions no longer apply after the points changed
+        self.history.clear()
+        self._update_undo_buttons()
 
-            coord_keys = {"x", "y", "z", "t"}
+    def _coordinate_columns(self) -> dict[str, int]:
+        """Return the axis in the layer data of each coordinate column in the table"""
 
-            # Set non-coordinate, properties to NaN for affected points only
-            for key, values in props.items():
-                if key not in coord_keys:
-                    # Convert integer arrays to float so they can hold NaN
-                    if not np.issubdtype(values.dtype, np.floating):
-                        values = values.astype(float)
+        axes = {"t": 0, "z": -3, "y": -2, "x": -1}
+        return {
+            column: axis for column, axis in axes.items() if column in self.df.columns
+        }
 
-                    values[indices] = np.nan
-                    props[key] = values
+    def _remove_rows(self, indices: np.ndarray) -> None:
+        """Remove the rows of the points that were removed from the layer at indices"""
 
-            # Assign back to the layer and refresh the table
-            self.df = pd.DataFrame(props)
-            to_select = indices
+        indices = np.unique(indices)
+        present = indices[np.isin(indices, self.df.index)]
+        rows = self.df.index.get_indexer(present)
 
-        self._set_data()
-        self._layer.selected_data = to_select
-        self._undo_info = None
-        self.undo_button.setEnabled(False)
+        self.df = self.df.drop(index=present)
+
+        # The points after a removed point move up in the layer, relabel their rows the
+        # same way, which also keeps the labels in line with the layer when the table
+        # is sorted.
+        labels = self.df.index.to_numpy()
+        self.df.index = labels - np.searchsorted(indices, labels)
+
+        self._model.remove_rows(rows, self.df)
 
+    def _append_rows(self) -> None:
+        """Add rows for the points added at the end of the layer, with their coordinates
+        and no measurements."""
+
+        start, stop = len(self.df), len(self._layer.data)
+        rows = pd.DataFrame(
+            np.nan, index=range(start, stop), columns=self.df.columns
+        )
+        for column, axis in self._coordinate_columns().items():
+            rows[column] = self._layer.data[start:stop, axis]
+
+        self.df = pd.concat([self.df, rows])
+        self._model.append_rows(self.df)
+
+    def _update_rows(self, indices: np.ndarray) -> None:
+        """Update the coordinates of the points at indices, and clear their measurements,
+        which no longer apply to the new positions."""
+
+        if len(indices) == 0:
+            return
+
+        rows = self.df.index.get_indexer(indices)
+        coordinate_columns = self._coordinate_columns()
+        values = {
+            column: self._layer.data[indices, axis]
+            for column, axis in coordinate_columns.items()
+        }
+        for column in self.df.columns.difference(list(coordinate_columns)):
+            # integer columns cannot hold NaN
+            if pd.api.types.is_integer_dtype(
+                self.df[column]
+            ) or pd.api.types.is_bool_dtype(self.df[column]):
+                self.df[column] = self.df[column].astype(float)
+            values[column] = np.full(len(rows), np.nan)
+
+        if len(rows) * len(values) <= self.max_updated_cells:
+            # Setting single cells does not copy the columns, unlike setting (a slice of)
+            # a column that shares its block with other columns. Dragging a few points
+            # therefore does not depend on the size of the table.
+            for column, column_values in values.items():
+                column_index = self.df.columns.get_loc(column)
+                for row, value in zip(rows, column_values, strict=True):
+                    self.df.iat[row, column_index] = value
+        else:
+            for column, column_values in values.items():
+                updated = self.df[column].to_numpy(copy=True)
+                updated[rows] = column_values
+                self.df[column] = updated
+
+        self._model.update_rows(rows, self.df, self._region_row_colors(rows))
 
     def _center_point(
         self, right: bool, ctrl: bool, index: QModelIndex
@@ -520,104 +780,129 @@ class InteractiveTableWidget(QWidget):
 
         self._updating_selection = True
         try:
-            selected_points = copy.deepcopy(self._layer.selected_data)
-            with QSignalBlocker(self._table_widget.selectionModel()):
-                self._table_widget.clearSelection()
-                self._select_rows(selected_points)
+            indices = np.fromiter(
+                self._layer.selected_data,
+                dtype=int,
+                count=len(self._layer.selected_data),
+            )
+            # the rows need not be in the order of the points, e.g. after sorting
+            rows = self.df.index.get_indexer(indices)
+            self._select_rows(rows[rows >= 0])
 
         finally:
             self._updating_selection = False
 
-    def _select_rows(self, rows: list[int]) -> None:
+    def _select_rows(self, rows: list[int] | np.ndarray) -> None:
         """Select exactly the given rows in the table."""
 
         selection_model = self._table_widget.selectionModel()
         model = self._table_widget.model()
 
+        # select ranges of consecutive rows, rather than each row on its own
+        rows = np.unique(np.asarray(rows, dtype=int))
         selection = QItemSelection()
+        if len(rows):
+            breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+            firsts = rows[np.r_[0, breaks]].tolist()
+            lasts = rows[np.r_[breaks - 1, -1]].tolist()
+            last_column = max(model.columnCount() - 1, 0)
+            for first, last in zip(firsts, lasts, strict=True):
+                selection.select(
+                    model.index(first, 0), model.index(last, last_column)
+                )
 
-        for row in sorted(rows):
-            index = model.index(row, 0)
-            selection.select(index, index)
-
-        # Block table selection signals while updating
+        # Block table selection signals while updating. The ranges already span all
+        # columns: expanding them to rows with the Rows flag takes Qt quadratic time in
+        # the number of ranges.
         with QSignalBlocker(selection_model):
-            selection_model.clearSelection()
             selection_model.select(
-                selection,
-                QItemSelectionModel.SelectionFlag.Select
-                | QItemSelectionModel.SelectionFlag.Rows,
+                selection, QItemSelectionModel.SelectionFlag.ClearAndSelect
             )
+        if self._highlight_delegate is not None:
+            self._highlight_delegate.set_selected_rows(rows)
 
         # Optionally scroll to the first selected row
-        if rows:
-            self._table_widget.scrollTo(
-                model.index(sorted(rows)[0], 0)
-            )
+        if len(rows):
+            self._table_widget.scrollTo(model.index(int(rows[0]), 0))
 
     def _delete_points(self) -> None:
-        """Delete selected points and store enough information for one-step undo."""
+        """Delete the selected points, and keep them so that the deletion can be undone."""
 
+        rows = self._selected_table_rows()
+        if len(rows) == 0:
+            return
 
-        selected_rows = sorted(
-            {index.row() for index in self._table_widget.selectedIndexes()}
+        indices = np.sort(self.df.index.to_numpy()[rows])
+        deletion = Deletion(
+            indices=indices,
+            points=self._layer.data[indices].copy(),
+            rows=rows,
+            table_rows=self.df.iloc[rows].copy(),
         )
-        if not selected_rows:
-            return
+        self._apply_deletion(deletion)
+        self.history.push(deletion)
+        self._update_undo_buttons()
 
-        self._undo_info = [
-            {"row": row, "point": self._layer.data[row].copy()}
-            for row in selected_rows
-        ]
+    def _undo_delete_points(self) -> None:
+        """Restore the points of the last deletion."""
+
+        if not self.history.can_undo:
+            return
 
+        deletion = self.history.undo()
         self._deleting_points = True
         try:
-            self._layer.data = np.delete(
-                self._layer.data,
-                selected_rows,
-                axis=0,
-            )
-
-            self.undo_df = copy.deepcopy(self.df)
-            self.df = self.df.drop(index = selected_rows)
-            self.df = self.df.reset_index(drop = True)
+            self._layer.data = restore_points(self._layer.data, deletion)
+            self.df = restore_rows(self.df, deletion)
+            self._set_data()
 
+            # Select the restored points
+            self._layer.selected_data = deletion.indices.tolist()
         finally:
             self._deleting_points = False
 
-        self._set_data()
+        self._update_undo_buttons()
+
+    def _redo_delete_points(self) -> None:
+        """Delete the points of the last undone deletion again."""
 
-        self.undo_button.setEnabled(True)
+        if not self.history.can_redo:
+            return
 
+        self._apply_deletion(self.history.redo())
+        self._update_undo_buttons()
 
-    def _undo_delete_points(self) -> None:
-        """Undo the last point deletion."""
+    def _apply_deletion(self, deletion: Deletion) -> None:
+        """Remove the points of deletion from the layer and their rows from the table"""
 
-        if not self._undo_info:
-            return
+        keep = np.ones(len(self._layer.data), dtype=bool)
+        keep[deletion.indices] = False
+        keep_rows = keep[self.df.index.to_numpy()]
 
-        data = self._layer.data
+        # The table can have been sorted since the deletion was recorded (e.g. before a
+        # redo), so take its rows where they are now, for undo to put them back there.
+        deletion.rows = np.flatnonzero(~keep_rows)
+        deletion.table_rows = self.df.iloc[deletion.rows].copy()
 
         self._deleting_points = True
-        # Reinsert points in ascending row order
-        rows_to_select = []
-        for info in sorted(self._undo_info, key=lambda x: x["row"]):
-            data = np.insert(data, info["row"], info["point"], axis=0)
-            rows_to_select.append(info['row'])
-
-        self.df = self.undo_df
-        self._layer.data = data
+        try:
+            self._layer.data = self._layer.data[keep]
 
-        # Rebuild the table from the restored layer data
-        self._set_data()
+            # The points after a deleted point move up in the layer, relabel their rows
+            # the same way, with the new position of each kept point.
+            new_positions = np.cumsum(keep) - 1
+            self.df = self.df[keep_rows]
+            self.df.index = new_positions[self.df.index.to_numpy()]
+        finally:
+            self._deleting_points = False
 
-        # Select the restored data
-        self._layer.selected_data = rows_to_select
-        self._deleting_points = False
+        # only the deleted rows are removed from the view, rather than resetting it
+        self._model.remove_rows(deletion.rows, self.df)
+        self._update_point_count()
 
-        # disable undo since the table is now altered by the layer
-        self._undo_info = None
-        self.undo_button.setEnabled(False)
+    def _update_undo_buttons(self) -> None:
+        self.undo_button.setEnabled(self.history.can_undo)
+        self.redo_button.setEnabled(self.history.can_redo)
 
     def _sort_table(self, column_index: int) -> None:
         """Sorts the table in ascending or descending order
@@ -630,14 +915,165 @@ class InteractiveTableWidget(QWidget):
         self._set_data(column_index)
 
     def _save_table(self) -> None:
-        """Save table to csv file"""
+        """Save the table as (compressed) CSV, Parquet or Feather file"""
+
+        filename, selected_filter = QFileDialog.getSaveFileName(
+            self, "Save table", ".", ";;".join(EXPORT_FORMATS.values())
+        )
+        if not filename:
+            return
+
+        try:
+            export_format(filename)
+        except ValueError:
+            # add the extension of the chosen file type
+            fmt = next(
+                (f for f, name in EXPORT_FORMATS.items() if name == selected_filter),
+                "csv",
+            )
+            filename = f"{filename}.{fmt}"
+
+        self._export_table(filename)
+
+    def _export_table(
+        self, filename: str | Path, df: pd.DataFrame | None = None
+    ) -> None:
+        """Write the table (or df) to filename in a background thread, showing the
+        progress in a dialog from which the export can be cancelled"""
+
+        if self._export_worker is not None:
+            show_error("The table is still being saved.")
+            return
 
-        filename, _ = QFileDialog.getSaveFileName(
-            self, "Save as csv", ".", "*.csv"
+        # A shallow copy shares the data of the table. Thanks to copy-on-write, points
+        # edited while the table is being saved only copy the columns they change.
+        if df is None:
+            df = self.df.copy(deep=False)
+        self._export = iter_export(df, filename)
+
+        self._export_progress = QProgressDialog(
+            f"Saving {len(df)} rows...", "Cancel", 0, len(df), self
         )
-        pd.DataFrame(self.df).to_csv(filename)
+        self._export_progress.setWindowModality(Qt.WindowModal)
+        # only shown for saves that take a while
+        self._export_progress.setMinimumDuration(500)
+        self._export_progress.canceled.connect(self._cancel_export)
+
+        self._export_worker = _run_export(self._export)
+        self._export_worker.yielded.connect(self._export_progress.setValue)
+        self._export_worker.errored.connect(self._on_export_error)
+        self._export_worker.finished.connect(self._on_export_finished)
+        self._export_worker.start()
+
+    def _cancel_export(self) -> None:
+        """Stop saving the table, after the chunk that is being written"""
+
+        if self._export_worker is not None:
+            self._export_worker.quit()
+
+    def _on_export_error(self, error: Exception) -> None:
+        self._copied_file = None
+        show_error(f"Could not save the table: {error}")
+
+    def _on_export_finished(self) -> None:
+        """Clean up after the table is saved, or saving failed or was cancelled"""
+
+        # removes the partially written file if the export did not complete
+        self._export.close()
+        self._export = None
+        self._export_worker = None
+        self._export_progress.reset()
+        self._export_progress.deleteLater()
+        self._export_progress = None
+
+        # the file is only there if the export completed
+        if self._copied_file is not None and self._copied_file.exists():
+            data = QMimeData()
+            data.setUrls([QUrl.fromLocalFile(str(self._copied_file))])
+            data.setText(str(self._copied_file))
+            QApplication.clipboard().setMimeData(data)
+        self._copied_file = None
 
     def _copy_table(self) -> None:
-        """Copy table to clipboard"""
+        """Copy the selected rows (or all rows, if none are selected) in the shown
+        columns to the clipboard, as tab separated text that can be pasted into a
+        spreadsheet.
+
+        The text is formatted in a background thread. More than max_clipboard_rows
+        rows are saved to a temporary (Parquet, or without pyarrow, compressed CSV)
+        file instead, and the file is copied to the clipboard.
+        """
+
+        if self._copy_worker is not None or self._export_worker is not None:
+            return
+
+        rows = self._selected_table_rows()
+        columns = [
+            column
+            for i, column in enumerate(self.df.columns)
+            if not self._table_widget.isColumnHidden(i)
+        ]
+        # like when saving, a shallow copy does not copy the data of the table
+        df = self.df.iloc[rows] if len(rows) else self.df.copy(deep=False)
+        df = df[columns]
+
+        if len(df) > self.max_clipboard_rows:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                extension = "csv.gz"
+            else:
+                extension = "parquet"
+            directory = Path(tempfile.mkdtemp(prefix="trackpy-points-"))
+            self._copied_file = directory / f"points.{extension}"
+            show_warning(
+                f"{len(df)} rows are too many to copy as text (the limit is "
+                f"{self.max_clipboard_rows}): they are saved to {self._copied_file} "
+                "instead, and the file is copied to the clipboard."
+            )
+            self._export_table(self._copied_file, df)
+            return
+
+        self._copy_worker = _format_rows(df)
+        self._copy_worker.returned.connect(QApplication.clipboard().setText)
+        self._copy_worker.errored.connect(self._on_copy_error)
+        self._copy_worker.finished.connect(self._on_copy_finished)
+        self._copy_worker.start()
+
+    def _on_copy_error(self, error: Exception) -> None:
+        show_error(f"Could not copy the table: {error}")
+
+    def _on_copy_finished(self) -> None:
+        self._copy_worker = None
+
+    def _selected_table_rows(self) -> np.ndarray:
+        """Return the positions of the selected rows in the table, in increasing
+        order. Read from the selected ranges, rather than from every selected cell."""
+
+        return _selection_rows(self._table_widget.selectionModel().selection())
+
+
+def _selection_rows(selection: QItemSelection) -> np.ndarray:
+    """Return the rows in the ranges of selection, in increasing order"""
+
+    if selection.isEmpty():
+        return np.empty(0, dtype=int)
+    rows = np.concatenate(
+        [np.arange(r.top(), r.bottom() + 1) for r in selection]
+    )
+    return np.unique(rows)
+
+
+@thread_worker(start_thread=False)
+def _run_export(rows_written: Iterator[int]) -> Iterator[int]:
+    """Write a table in a background thread, one chunk at a time"""
+
+    yield from rows_written
+
+
+@thread_worker(start_thread=False)
+def _format_rows(df: pd.DataFrame) -> str:
+    """Format rows as tab separated text in a background thread, like pandas'
+    to_clipboard"""
 
-        pd.DataFrame(self.df).to_clipboard()
+    return df.to_csv(sep="\t")
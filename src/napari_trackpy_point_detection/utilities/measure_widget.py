@@ -3,16 +3,19 @@ import numpy as np
 from napari.utils.notifications import show_info
 from qtpy.QtWidgets import (
     QCheckBox,
+    QDoubleSpinBox,
     QGroupBox,
     QHBoxLayout,
     QLabel,
     QPushButton,
+    QSpinBox,
     QVBoxLayout,
     QWidget,
 )
 
 from .interactive_table_widget import InteractiveTableWidget
 from .layer_dropdown import LayerDropdown
+from .sampling import STATISTICS, neighbourhood_statistics, sample_points
 
 
 class MeasureWidget(QWidget):
@@ -63,6 +66,29 @@ class MeasureWidget(QWidget):
         intensity_layout.addWidget(QLabel("Intensity layer"))
         intensity_layout.addWidget(self.intensity_layer_dropdown)
 
+        neighbourhood_settings = QGroupBox("Neighbourhood radius (pixels)")
+        neighbourhood_settings.setToolTip("Also measure the mean, max and sum of the intensity within this radius around each point, and the mass: the sum after subtracting the background, which is the mean intensity in a shell of the given width around the neighbourhood. A radius of 0 only measures the intensity at the point.")
+        self.radius_spinbox_xy = QDoubleSpinBox()
+        self.radius_spinbox_xy.setRange(0, 100)
+        self.radius_spinbox_xy.setValue(0)
+        self.radius_spinbox_z = QDoubleSpinBox()
+        self.radius_spinbox_z.setRange(0, 100)
+        self.radius_spinbox_z.setValue(0)
+        self.radius_spinbox_z.setToolTip("Radius along z, for points with a z coordinate.")
+        self.background_spinbox = QSpinBox()
+        self.background_spinbox.setRange(0, 100)
+        self.background_spinbox.setValue(2)
+        self.background_spinbox.setToolTip("Width of the background shell. A width of 0 does not subtract a background.")
+
+        neighbourhood_layout = QHBoxLayout()
+        neighbourhood_layout.addWidget(QLabel("XY"))
+        neighbourhood_layout.addWidget(self.radius_spinbox_xy)
+        neighbourhood_layout.addWidget(QLabel("Z"))
+        neighbourhood_layout.addWidget(self.radius_spinbox_z)
+        neighbourhood_layout.addWidget(QLabel("Background"))
+        neighbourhood_layout.addWidget(self.background_spinbox)
+        neighbourhood_settings.setLayout(neighbourhood_layout)
+
         self.measure_btn = QPushButton("Measure")
         self.measure_btn.setEnabled(False)
         self.measure_btn.clicked.connect(self._measure)
@@ -71,6 +97,7 @@ class MeasureWidget(QWidget):
         box_layout.addLayout(intensity_layout)
         box_layout.addLayout(checkbox_layout)
         box_layout.addLayout(regions_layout)
+        box_layout.addWidget(neighbourhood_settings)
         box_layout.addWidget(self.measure_btn)
 
         box = QGroupBox("Measure intensities")
@@ -149,7 +176,10 @@ class MeasureWidget(QWidget):
     def _fits_points(self, layer: napari.layers.Layer) -> bool:
         """Check that ``layer`` can be indexed with the point coordinates."""
 
-        if layer.ndim > self.points.ndim:
+        # Points are detected without the axes of length 1, so the layer they were
+        # detected on can have extra (leading) axes of length 1.
+        extra_axes = layer.data.shape[: max(layer.ndim - self.points.ndim, 0)]
+        if any(s != 1 for s in extra_axes):
             show_info(
                 f"Cannot measure in '{layer.name}': it has more dimensions "
                 f"({layer.ndim}) than the points ({self.points.ndim})."
@@ -158,8 +188,8 @@ class MeasureWidget(QWidget):
 
         return True
 
-    def _sample(self, layer: napari.layers.Layer) -> np.ndarray:
-        """Read one value from ``layer`` for each point.
+    def _layer_coordinates(self, layer: napari.layers.Layer) -> np.ndarray:
+        """Return the coordinates of the points in the data of ``layer``.
 
         The points and the measured layer can carry a different scale and translate, so
         the points are taken to world coordinates first. Rotation, shear and affine
@@ -173,26 +203,58 @@ class MeasureWidget(QWidget):
 
         # Layer dimensions are right-aligned with the world dimensions, so a layer with
         # fewer dimensions than the points (e.g. a 3D regions layer for 4D points) is
-        # indexed with the trailing coordinates.
+        # indexed with the trailing coordinates. Extra leading axes of the layer have
+        # length 1, and are indexed at 0.
         world = world[:, -layer.ndim :]
-        coordinates = (world - np.asarray(layer.translate)) / np.asarray(
-            layer.scale
-        )
-        coordinates = np.round(coordinates).astype(int)
+        n_extra = layer.ndim - world.shape[1]
+        world = np.pad(world, ((0, 0), (n_extra, 0)))
+        return (world - np.asarray(layer.translate)) / np.asarray(layer.scale)
 
-        # Points can sit just outside the array (e.g. after moving one to the very
-        # edge), which would raise on indexing.
-        data = layer.data
-        index = tuple(np.clip(coordinates, 0, np.asarray(data.shape) - 1).T)
+    def _sample(self, layer: napari.layers.Layer) -> np.ndarray:
+        """Read one value from ``layer`` for each point.
 
-        # Dask has no pointwise fancy indexing over multiple axes, but offers ``vindex``.
-        values = data.vindex[index] if hasattr(data, "vindex") else data[index]
+        The points are sampled per chunk of the layer data, so that each chunk of a
+        dask or zarr array is read once, one chunk at a time.
+        """
 
-        return np.asarray(values)
+        return sample_points(layer.data, self._layer_coordinates(layer))
+
+    def _neighbourhood_radius(
+        self, layer: napari.layers.Layer
+    ) -> tuple[np.ndarray, np.ndarray | None]:
+        """Return the neighbourhood radius per axis of ``layer``, and the radius of
+        the background shell (None without background)"""
+
+        radius = np.zeros(layer.ndim)
+        radius[-2:] = self.radius_spinbox_xy.value()
+        if "z" in self.table_widget.df.columns and layer.ndim >= 3:
+            radius[-3] = self.radius_spinbox_z.value()
+
+        width = self.background_spinbox.value()
+        if width == 0:
+            return radius, None
+        return radius, np.where(radius > 0, radius + width, 0)
+
+    def _measure_neighbourhoods(
+        self, layer: napari.layers.Layer
+    ) -> dict[str, np.ndarray]:
+        """Measure the statistics of the neighbourhood of each point in ``layer``"""
+
+        radius, background_radius = self._neighbourhood_radius(layer)
+        statistics = neighbourhood_statistics(
+            layer.data,
+            self._layer_coordinates(layer),
+            radius,
+            background_radius,
+        )
+        return {
+            f"intensity_{name}": values for name, values in statistics.items()
+        }
 
     def _measure(self) -> None:
-        """Measure the intensity at each point, optionally together with the region it
-        falls in, and add the results to the table."""
+        """Measure the intensity at each point, optionally together with statistics of
+        its neighbourhood and the region it falls in, and add the results to the
+        table."""
 
         if self.points is None or self.intensity_layer is None:
             return
@@ -201,8 +263,15 @@ class MeasureWidget(QWidget):
             return
 
         measurements = {"intensity": self._sample(self.intensity_layer)}
+        # measurements made earlier that no longer apply
+        drop = ["region"]
+        if self.radius_spinbox_xy.value() > 0:
+            measurements.update(
+                self._measure_neighbourhoods(self.intensity_layer)
+            )
+        else:
+            drop += [f"intensity_{name}" for name in STATISTICS]
         colormap = None
-        drop = ("region",)  # a region measured earlier no longer applies
 
         if self.use_regions_checkbox.isChecked() and self.regions is not None:
             regions = self._regions_as_labels()
@@ -211,10 +280,10 @@ class MeasureWidget(QWidget):
             measurements["region"] = self._sample(regions)
             # give each table row the color of the region it falls in
             colormap = regions.colormap
-            drop = ()
+            drop.remove("region")
 
         self.table_widget.add_measurements(
-            measurements, region_colormap=colormap, drop=drop
+            measurements, region_colormap=colormap, drop=tuple(drop)
         )
         self._update_visibility()
 
@@ -0,0 +1,160 @@
+import napari
+import pandas as pd
+from napari.utils.notifications import show_error
+from qtpy.QtCore import QTimer
+from qtpy.QtWidgets import (
+    QAbstractItemView,
+    QCheckBox,
+    QFileDialog,
+    QHBoxLayout,
+    QLabel,
+    QPushButton,
+    QTableWidget,
+    QTableWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+from .profiling import Profiler, get_profiler, set_profiler
+
+
+class ProfilerWidget(QWidget):
+    """Dock panel that records how long each stage of a detection (and of the layer
+    and table updates after it) takes, with a summary per stage, and exports the
+    records as JSON or as a Chrome trace."""
+
+    columns = ("Stage", "Calls", "Wall (s)", "CPU (s)", "Peak (MiB)")
+
+    def __init__(self, viewer: napari.Viewer):
+        super().__init__()
+        self.viewer = viewer
+        self.profiler = Profiler()
+        self._n_shown = 0
+
+        self.record_cb = QCheckBox("Record timings")
+        self.record_cb.setToolTip("Record the wall time, CPU time and (optionally) peak memory allocation of each stage of the next detections.")
+        self.record_cb.toggled.connect(self._toggle_recording)
+        self.memory_cb = QCheckBox("Trace memory")
+        self.memory_cb.setToolTip("Also record the peak memory allocated per stage. This slows down the detection.")
+        self.memory_cb.toggled.connect(self._toggle_memory)
+        record_layout = QHBoxLayout()
+        record_layout.addWidget(self.record_cb)
+        record_layout.addWidget(self.memory_cb)
+
+        self.table = QTableWidget(0, len(self.columns))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.frames_label = QLabel("No stages recorded")
+
+        clear_btn = QPushButton("Clear")
+        clear_btn.clicked.connect(self._clear)
+        json_btn = QPushButton("Export JSON")
+        json_btn.clicked.connect(self._export_json)
+        trace_btn = QPushButton("Export Chrome trace")
+        trace_btn.clicked.connect(self._export_trace)
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(clear_btn)
+        button_layout.addWidget(json_btn)
+        button_layout.addWidget(trace_btn)
+
+        layout = QVBoxLayout()
+        layout.addLayout(record_layout)
+        layout.addWidget(self.table)
+        layout.addWidget(self.frames_label)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        # Stages are recorded from the detection thread, so the summary is refreshed
+        # from here rather than on every record.
+        self._timer = QTimer(self)
+        self._timer.setInterval(500)
+        self._timer.timeout.connect(self._refresh)
+
+    def _toggle_recording(self, record: bool) -> None:
+        """Start or stop reporting the stages to this panel's profiler"""
+
+        if record:
+            set_profiler(self.profiler)
+            self._timer.start()
+        else:
+            if get_profiler() is self.profiler:
+                set_profiler(None)
+            self._timer.stop()
+            self._refresh()
+
+    def _toggle_memory(self, trace: bool) -> None:
+        """Trace memory allocations from now on, or stop tracing them"""
+
+        # (re)starting the profiler starts or stops tracemalloc
+        recording = get_profiler() is self.profiler
+        if recording:
+            set_profiler(None)
+        self.profiler.trace_memory = trace
+        if recording:
+            set_profiler(self.profiler)
+
+    def _refresh(self) -> None:
+        """Show the summary per stage, if anything was recorded since the last time"""
+
+        n_records = len(self.profiler.records)
+        if n_records == self._n_shown:
+            return
+        self._n_shown = n_records
+
+        summary = self.profiler.summary()
+        self.table.setRowCount(len(summary))
+        for row, stage in enumerate(summary.itertuples(index=False)):
+            peak = "" if pd.isna(stage.peak) else f"{stage.peak / 2**20:.1f}"
+            values = (
+                stage.name,
+                str(stage.calls),
+                f"{stage.wall:.3f}",
+                f"{stage.cpu:.3f}",
+                peak,
+            )
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(value))
+        self.table.resizeColumnsToContents()
+
+        frames = self.profiler.to_dataframe()["frame"].dropna()
+        self.frames_label.setText(
+            f"{n_records} stages recorded, in {frames.nunique()} frames"
+        )
+
+    def _clear(self) -> None:
+        """Remove all records"""
+
+        self.profiler.clear()
+        self._n_shown = 0
+        self.table.setRowCount(0)
+        self.frames_label.setText("No stages recorded")
+
+    def _export_json(self) -> None:
+        """Save the records and the summary per stage as JSON"""
+
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Save timings as JSON", ".", "*.json"
+        )
+        if filename:
+            self._export(self.profiler.save_json, filename)
+
+    def _export_trace(self) -> None:
+        """Save the records as a trace for chrome://tracing or Perfetto"""
+
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Save Chrome trace", ".", "*.json"
+        )
+        if filename:
+            self._export(self.profiler.save_chrome_trace, filename)
+
+    def _export(self, save, filename: str) -> None:
+        try:
+            save(filename)
+        except OSError as e:
+            show_error(f"Could not save the timings: {e}")
+
+    def closeEvent(self, event) -> None:
+        # stop profiling when the panel goes away
+        self.record_cb.setChecked(False)
+        super().closeEvent(event)
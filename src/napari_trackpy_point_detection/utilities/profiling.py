@@ -0,0 +1,225 @@
+import itertools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import pandas as pd
+
+
+@dataclass
+class StageRecord:
+    """Timing of one run of a stage, in seconds since the profiler started, and the
+    peak memory allocated during it, in bytes (None when memory is not traced)."""
+
+    name: str
+    frame: int | None
+    start: float
+    wall: float
+    cpu: float
+    peak: int | None
+    thread: int
+
+
+class Profiler:
+    """Records the wall time, CPU time and peak memory allocation of the stages of
+    a detection (loading a frame, binning, blurring, locating, ...) and of the updates
+    of the layers and table that follow.
+
+    Stages are timed with the stage context manager, and can be nested: a stage
+    without a frame index takes the frame of the stage it runs in. CPU time is that of
+    the whole process. Memory is traced with tracemalloc, which slows down the stages
+    (mostly those making many small allocations, like trackpy.locate), and counts the
+    allocations of all threads. Stages that run in worker processes are not recorded,
+    only the time their frames take.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.records: list[StageRecord] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # highest traced memory seen by each open stage, from all threads
+        self._open_peaks: dict[int, int] = {}
+        self._stage_ids = itertools.count()
+
+    @contextmanager
+    def stage(self, name: str, frame: int | None = None) -> Iterator[None]:
+        """Time the code run within this context as stage name (of frame)"""
+
+        stack = self._local.__dict__.setdefault("stack", [])
+        if frame is None and stack:
+            frame = stack[-1]
+        stack.append(frame)
+
+        trace = self.trace_memory and tracemalloc.is_tracing()
+        if trace:
+            key, start_memory = self._open_memory_stage()
+
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - start_cpu
+            peak = self._close_memory_stage(key, start_memory) if trace else None
+            stack.pop()
+
+            record = StageRecord(
+                name=name,
+                frame=frame,
+                start=start - self._origin,
+                wall=wall,
+                cpu=cpu,
+                peak=peak,
+                thread=threading.get_ident(),
+            )
+            with self._lock:
+                self.records.append(record)
+
+    def _open_memory_stage(self) -> tuple[int, int]:
+        """Start following the peak traced memory for a new stage"""
+
+        with self._lock:
+            current, _ = self._update_open_peaks()
+            key = next(self._stage_ids)
+            self._open_peaks[key] = current
+        return key, current
+
+    def _close_memory_stage(self, key: int, start_memory: int) -> int | None:
+        """Return the peak memory allocated since the stage opened, or None if memory
+        tracing stopped in the meantime"""
+
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                self._open_peaks.pop(key)
+                return None
+            self._update_open_peaks()
+            return self._open_peaks.pop(key) - start_memory
+
+    def _update_open_peaks(self) -> tuple[int, int]:
+        """Pass the peak traced memory to all open stages, and start measuring a new
+        peak. Must be called with the lock held."""
+
+        current, peak = tracemalloc.get_traced_memory()
+        for key, open_peak in self._open_peaks.items():
+            self._open_peaks[key] = max(open_peak, peak)
+        tracemalloc.reset_peak()
+        return current, peak
+
+    def clear(self) -> None:
+        """Remove all records"""
+
+        with self._lock:
+            self.records = []
+            self._origin = time.perf_counter()
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Return one row per record"""
+
+        with self._lock:
+            records = list(self.records)
+        df = pd.DataFrame(
+            [asdict(record) for record in records],
+            columns=list(StageRecord.__dataclass_fields__),
+        )
+        # frames and peaks can be missing
+        return df.astype({"frame": "Int64", "peak": "Int64"})
+
+    def summary(self) -> pd.DataFrame:
+        """Return the number of calls, total wall and CPU time and the largest peak
+        allocation per stage, in the order the stages first ran"""
+
+        df = self.to_dataframe()
+        return (
+            df.groupby("name", sort=False)
+            .agg(
+                calls=("wall", "size"),
+                wall=("wall", "sum"),
+                cpu=("cpu", "sum"),
+                peak=("peak", "max"),
+            )
+            .reset_index()
+        )
+
+    def save_json(self, path: str | Path) -> None:
+        """Write all records, and the summary per stage, to a JSON file"""
+
+        content = {
+            "records": self.to_dataframe().to_dict(orient="records"),
+            "summary": self.summary().to_dict(orient="records"),
+        }
+        Path(path).write_text(json.dumps(content, indent=2, default=_json_value))
+
+    def save_chrome_trace(self, path: str | Path) -> None:
+        """Write the records as a trace that can be opened in chrome://tracing or
+        https://ui.perfetto.dev"""
+
+        with self._lock:
+            records = list(self.records)
+
+        events = []
+        for record in records:
+            args = {"cpu_ms": record.cpu * 1e3}
+            if record.frame is not None:
+                args["frame"] = record.frame
+            if record.peak is not None:
+                args["peak_mib"] = record.peak / 2**20
+            events.append(
+                {
+                    "name": record.name,
+                    "cat": "detection",
+                    "ph": "X",
+                    "ts": record.start * 1e6,
+                    "dur": record.wall * 1e6,
+                    "pid": os.getpid(),
+                    "tid": record.thread,
+                    "args": args,
+                }
+            )
+
+        Path(path).write_text(json.dumps({"traceEvents": events}))
+
+
+def _json_value(value):
+    """Convert numpy scalars and missing values for json.dumps"""
+
+    if pd.isna(value):
+        return None
+    return value.item()
+
+
+# The profiler that stage reports to, None when profiling is off
+_profiler = None
+
+
+def get_profiler() -> Profiler | None:
+    return _profiler
+
+
+def set_profiler(profiler: Profiler | None) -> None:
+    """Start reporting stages to profiler, or stop profiling with None. Memory is
+    traced (by starting tracemalloc) when the profiler asks for it."""
+
+    global _profiler
+    if _profiler is not None and _profiler.trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    if profiler is not None and profiler.trace_memory:
+        tracemalloc.start()
+    _profiler = profiler
+
+
+def stage(name: str, frame: int | None = None):
+    """Time the code run within this context as a stage of the active profiler. Does
+    nothing when profiling is off."""
+
+    if _profiler is None:
+        return nullcontext()
+    return _profiler.stage(name, frame)
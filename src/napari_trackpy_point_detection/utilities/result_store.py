@@ -0,0 +1,222 @@
+import hashlib
+import json
+import math
+import os
+from collections.abc import Callable, Hashable, Iterator
+from dataclasses import asdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .detection import DetectionParameters, is_time_series, iter_detect
+from .frame_cache import FrameCache
+
+
+def image_fingerprint(
+    img: np.ndarray, source: str | None = None, n_blocks: int = 8
+) -> str:
+    """Identify image data by its shape, dtype and source (e.g. the path it was read
+    from), together with a hash of a coarse sample of a few of its blocks. Only the
+    sampled blocks are read, so that large (lazy) images are fingerprinted quickly.
+
+    Args:
+        img (np.ndarray): numpy, dask or zarr array.
+        source (str): optional path or other description of where img came from.
+        n_blocks (int): number of (evenly spaced) chunks of img to sample. A numpy
+            array is treated as a single chunk.
+    """
+
+    fingerprint = hashlib.sha1(
+        repr((tuple(img.shape), str(img.dtype), source)).encode()
+    )
+
+    chunks = getattr(img, "chunks", None)
+    if chunks is None:
+        block_shape = img.shape
+    else:
+        # dask arrays list all chunk sizes per axis, zarr arrays a single size
+        block_shape = tuple(c if isinstance(c, int) else c[0] for c in chunks)
+
+    grid = [
+        math.ceil(n / b)
+        for n, b in zip(img.shape, block_shape, strict=True)
+    ]
+    n_total = math.prod(grid)
+    for block in np.unique(
+        np.linspace(0, n_total - 1, min(n_blocks, n_total)).astype(int)
+    ):
+        block_index = np.unravel_index(block, grid)
+        # up to 32 samples along each axis of the block
+        sample = tuple(
+            slice(i * b, min((i + 1) * b, n), max(1, b // 32))
+            for i, b, n in zip(
+                block_index, block_shape, img.shape, strict=True
+            )
+        )
+        fingerprint.update(np.ascontiguousarray(np.asarray(img[sample])).tobytes())
+
+    return fingerprint.hexdigest()
+
+
+class ResultStore:
+    """Detections stored on disk, per image (fingerprint) and detection parameters.
+
+    Each run is a directory with one Parquet table per frame, written as soon as the
+    frame is done, and a parameters.json that is written last, marking the run as
+    complete:
+
+        <directory>/<image fingerprint>/<parameters hash>/frame_00000.parquet
+
+    The frames of an incomplete (interrupted) run serve as checkpoints to resume it
+    from. Every file is written to a temporary file first and then renamed, so that
+    a crash never leaves a partially written frame behind.
+    """
+
+    def __init__(self, directory: str | Path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError(
+                "Storing detections requires pyarrow: pip install pyarrow"
+            ) from e
+
+        self.directory = Path(directory)
+
+    def load(
+        self, fingerprint: str, params: DetectionParameters
+    ) -> list[pd.DataFrame] | None:
+        """Return the stored detections per frame, or None if there is no complete
+        run with these parameters"""
+
+        run = self._run_directory(fingerprint, params)
+        try:
+            n_frames = json.loads((run / "parameters.json").read_text())["n_frames"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+        try:
+            return [pd.read_parquet(self._frame_path(run, t)) for t in range(n_frames)]
+        except OSError:
+            return None
+
+    def load_checkpoints(
+        self, fingerprint: str, params: DetectionParameters
+    ) -> dict[int, pd.DataFrame]:
+        """Return the detections of the frames that are done, by frame index, of a
+        (possibly incomplete) run with these parameters"""
+
+        run = self._run_directory(fingerprint, params)
+        frames = {}
+        for path in run.glob("frame_*.parquet"):
+            try:
+                frames[int(path.stem.removeprefix("frame_"))] = pd.read_parquet(path)
+            except (OSError, ValueError):
+                # not a frame of this run, or unreadable: detect the frame again
+                continue
+        return frames
+
+    def save_frame(
+        self,
+        fingerprint: str,
+        params: DetectionParameters,
+        t: int,
+        d_t: pd.DataFrame,
+    ) -> None:
+        """Store the detections in frame t"""
+
+        run = self._run_directory(fingerprint, params)
+        run.mkdir(parents=True, exist_ok=True)
+        path = self._frame_path(run, t)
+        _write_atomic(path, lambda tmp: d_t.to_parquet(tmp, index=False))
+
+    def complete(
+        self, fingerprint: str, params: DetectionParameters, n_frames: int
+    ) -> None:
+        """Mark the run as complete, once all n_frames frames are stored"""
+
+        run = self._run_directory(fingerprint, params)
+        run.mkdir(parents=True, exist_ok=True)
+        description = json.dumps(
+            {**_result_parameters(params), "n_frames": n_frames}, indent=2
+        )
+        _write_atomic(run / "parameters.json", lambda tmp: tmp.write_text(description))
+
+    def _run_directory(self, fingerprint: str, params: DetectionParameters) -> Path:
+        """Directory of the run on the image with these parameters"""
+
+        key = json.dumps(_result_parameters(params), sort_keys=True)
+        return self.directory / fingerprint / hashlib.sha1(key.encode()).hexdigest()
+
+    @staticmethod
+    def _frame_path(run: Path, t: int) -> Path:
+        return run / f"frame_{t:05d}.parquet"
+
+
+def _write_atomic(path: Path, write: Callable[[Path], object]) -> None:
+    """Write path by calling write on a temporary file next to it, which then
+    replaces path in one step"""
+
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _result_parameters(params: DetectionParameters) -> dict:
+    """The parameters that the detections depend on (for params that apply to the
+    image, see DetectionParameters.for_image)"""
+
+    description = asdict(params)
+    del description["n_workers"]
+    if not params.use_z:
+        for name in ("diameter_z", "separation_z", "downsample_z", "sigma_z"):
+            del description[name]
+    return description
+
+
+def iter_detect_stored(
+    img: np.ndarray,
+    params: DetectionParameters,
+    store: ResultStore,
+    source: str | None = None,
+    cache: FrameCache | None = None,
+    image_key: Hashable = None,
+) -> Iterator[pd.DataFrame]:
+    """Like iter_detect, but load the detections from store if the image was detected
+    with the same parameters before.
+
+    Each frame is stored as soon as it is done. A run that was stopped early (e.g.
+    cancelled, or by a crash) resumes where it left off: frames that are already
+    stored are loaded, and only the others are detected. Changing a parameter that
+    does not affect preprocessing (like the percentile or separation) detects again,
+    but can still take the preprocessed frames from cache. Only the detections are
+    stored, not the preprocessed frames, so in a new session (or from the command
+    line, which has no cache) every frame is preprocessed again.
+    """
+
+    params = params.for_image(img)
+    fingerprint = image_fingerprint(img, source)
+
+    frames = store.load(fingerprint, params)
+    if frames is not None:
+        yield from frames
+        return
+
+    n_frames = img.shape[0] if is_time_series(img, params.use_z) else 1
+    done = store.load_checkpoints(fingerprint, params)
+    todo = [t for t in range(n_frames) if t not in done]
+    detections = iter_detect(img, params, cache, image_key, time_points=todo)
+
+    # yield the stored and the detected frames in frame order
+    for t in range(n_frames):
+        if t in done:
+            yield done[t]
+            continue
+        d_t = next(detections)
+        store.save_frame(fingerprint, params, t, d_t)
+        yield d_t
+
+    store.complete(fingerprint, params, n_frames)
@@ -0,0 +1,257 @@
+from collections.abc import Iterator, Sequence
+
+import numpy as np
+
+from .profiling import stage
+
+# the statistics returned by neighbourhood_statistics
+STATISTICS = ("mean", "max", "sum", "background", "mass")
+
+
+def ellipsoid_offsets(
+    radius: Sequence[float], inner_radius: Sequence[float] | None = None
+) -> np.ndarray:
+    """Return the offsets (k, ndim) of the voxels within the ellipsoid with radius
+    (per axis, in voxels), and outside the one with inner_radius if given. Axes with a
+    radius of 0 (e.g. time) are not extended."""
+
+    radius = np.asarray(radius, dtype=float)
+    reach = np.floor(radius).astype(int)
+    grid = np.stack(
+        np.meshgrid(*(np.arange(-r, r + 1) for r in reach), indexing="ij"),
+        axis=-1,
+    ).reshape(-1, len(radius))
+
+    inside = _ellipsoid_distance(grid, radius) <= 1
+    if inner_radius is not None:
+        inner_radius = np.asarray(inner_radius, dtype=float)
+        inside &= _ellipsoid_distance(grid, inner_radius) > 1
+    return grid[inside]
+
+
+def _ellipsoid_distance(offsets: np.ndarray, radius: np.ndarray) -> np.ndarray:
+    """Return the squared distance of offsets to the origin, scaled so that 1 lies on
+    the ellipsoid with radius. Along axes with radius 0 only the origin is inside."""
+
+    extended = radius > 0
+    distance = ((offsets[:, extended] / radius[extended]) ** 2).sum(axis=1)
+    off_axis = np.any(offsets[:, ~extended] != 0, axis=1)
+    return np.where(off_axis, np.inf, distance)
+
+
+# arrays without chunks (numpy) are processed in blocks of at most this many voxels
+MAX_BLOCK_VOXELS = 2**24
+
+
+def chunk_boundaries(data) -> list[np.ndarray]:
+    """Return the boundaries of the chunks of data along each axis, from 0 to the
+    length of the axis. Arrays without chunks (numpy) are split into blocks of at
+    most MAX_BLOCK_VOXELS, e.g. one frame or a few planes of a time series each."""
+
+    chunks = getattr(data, "chunks", None)
+    if chunks is None:
+        return [
+            np.r_[np.arange(0, n, b), n]
+            for n, b in zip(data.shape, _block_shape(data.shape), strict=True)
+        ]
+
+    boundaries = []
+    for n, axis_chunks in zip(data.shape, chunks, strict=True):
+        if isinstance(axis_chunks, tuple):
+            # dask: the size of each chunk
+            boundaries.append(np.r_[0, np.cumsum(axis_chunks)])
+        else:
+            # zarr: one size for all chunks
+            boundaries.append(np.r_[np.arange(0, n, axis_chunks), n])
+    return boundaries
+
+
+def _block_shape(shape: tuple[int, ...]) -> tuple[int, ...]:
+    """Return the shape of the blocks to split an array without chunks into: the last
+    axes whole, as far as the block stays within MAX_BLOCK_VOXELS, and the axes before
+    them split."""
+
+    block = [1] * len(shape)
+    size = 1
+    for axis in reversed(range(len(shape))):
+        block[axis] = max(min(shape[axis], MAX_BLOCK_VOXELS // size), 1)
+        size *= block[axis]
+    return tuple(block)
+
+
+def iter_chunk_groups(
+    data, centers: np.ndarray, reach: Sequence[int] | None = None
+) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Group the points at centers (integer coordinates within data) by the chunk of
+    data they fall in, and yield (start, block, points) for each chunk with points.
+
+    block is the chunk, extended by reach voxels per axis (within data), read into
+    memory, start is its position in data, and points are the indices of the points
+    in the chunk. Only one block is read at a time.
+    """
+
+    if len(centers) == 0:
+        return
+
+    boundaries = chunk_boundaries(data)
+    reach = np.zeros(data.ndim, dtype=int) if reach is None else np.asarray(reach)
+
+    chunk_indices = np.stack(
+        [
+            np.searchsorted(bounds, centers[:, axis], side="right") - 1
+            for axis, bounds in enumerate(boundaries)
+        ],
+        axis=-1,
+    )
+    n_chunks = [len(bounds) - 1 for bounds in boundaries]
+    chunk_ids = np.ravel_multi_index(tuple(chunk_indices.T), n_chunks)
+    order = np.argsort(chunk_ids, kind="stable")
+    ids, firsts = np.unique(chunk_ids[order], return_index=True)
+
+    for chunk_id, points in zip(ids, np.split(order, firsts[1:]), strict=True):
+        chunk = np.unravel_index(chunk_id, n_chunks)
+        start = np.array(
+            [
+                max(b[c] - r, 0)
+                for b, c, r in zip(boundaries, chunk, reach, strict=True)
+            ]
+        )
+        stop = np.array(
+            [
+                min(b[c + 1] + r, n)
+                for b, c, r, n in zip(
+                    boundaries, chunk, reach, data.shape, strict=True
+                )
+            ]
+        )
+        with stage("load"):
+            block = np.asarray(data[tuple(map(slice, start, stop))])
+        yield start, block, points
+
+
+def sample_points(data, coordinates: np.ndarray) -> np.ndarray:
+    """Return the value of data at the voxel nearest to each point.
+
+    Args:
+        data: numpy, dask or zarr array.
+        coordinates (np.ndarray): (n, ndim) coordinates of the points, in voxels of
+            data. Points just outside data take the value of the nearest voxel within.
+
+    The points are grouped by the chunk (of a dask or zarr array, or block of a numpy
+    array, see chunk_boundaries) they fall in, and the chunks are read one at a time,
+    each only once. This keeps a single chunk in memory, rather than all chunks with
+    points, and reads each chunk from its store in one go.
+    """
+
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, data.ndim)
+    centers = np.round(coordinates).astype(int)
+    centers = np.clip(centers, 0, np.asarray(data.shape) - 1)
+
+    values = np.empty(len(centers), dtype=data.dtype)
+    with stage("sample"):
+        for start, block, points in iter_chunk_groups(data, centers):
+            values[points] = block[tuple((centers[points] - start).T)]
+    return values
+
+
+def neighbourhood_statistics(
+    data,
+    coordinates: np.ndarray,
+    radius: Sequence[float],
+    background_radius: Sequence[float] | None = None,
+    max_values: int = 2**24,
+) -> dict[str, np.ndarray]:
+    """Measure data in an ellipsoidal neighbourhood around each point.
+
+    Args:
+        data: numpy, dask or zarr array.
+        coordinates (np.ndarray): (n, ndim) coordinates of the points, in voxels of
+            data. The neighbourhoods are centered on the voxel nearest to each point.
+        radius (Sequence[float]): radius of the neighbourhood per axis, in voxels. An
+            axis with radius 0 (e.g. time) is not extended.
+        background_radius (Sequence[float] | None): the background of a point is the
+            mean of the shell between radius and background_radius around it. Without
+            background_radius, the background is 0.
+        max_values (int): at most this many voxel values are gathered at once, which
+            bounds the memory used on top of the chunk being read.
+
+    Returns:
+        dict[str, np.ndarray]: the mean, max and sum of each neighbourhood, the
+            background, and the mass: the sum after subtracting the background from
+            each voxel. Voxels outside data (and NaN voxels) are left out. When no
+            voxel of the shell lies within data, the background and mass are NaN.
+
+    The points are grouped by the chunk (of a dask or zarr array, or block of a numpy
+    array, see chunk_boundaries) they fall in. Each chunk is read once, together with
+    the border of its neighbours that the neighbourhoods reach into, so these borders
+    are read again with every neighbouring chunk. Only one (bordered) chunk is held in
+    memory at a time, as floats.
+    """
+
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, data.ndim)
+    centers = np.round(coordinates).astype(int)
+    centers = np.clip(centers, 0, np.asarray(data.shape) - 1)
+
+    offsets = ellipsoid_offsets(radius)
+    n_inner = len(offsets)
+    if background_radius is not None:
+        shell = ellipsoid_offsets(background_radius, inner_radius=radius)
+        offsets = np.concatenate([offsets, shell])
+    reach = np.abs(offsets).max(axis=0)
+
+    results = {name: np.full(len(centers), np.nan) for name in STATISTICS}
+    batch_size = max(max_values // len(offsets), 1)
+    with stage("neighbourhood statistics"):
+        for start, block, points in iter_chunk_groups(data, centers, reach):
+            # Pad the block with NaN, so that all neighbourhoods fit in it and the
+            # voxels outside data can be told apart. The voxels are then gathered with
+            # one flat index per voxel.
+            block = np.pad(
+                block.astype(float),
+                [(r, r) for r in reach],
+                constant_values=np.nan,
+            )
+            strides = np.array(block.strides) // block.itemsize
+            flat_offsets = offsets @ strides
+            flat_centers = (centers[points] - start + reach) @ strides
+            block = block.ravel()
+
+            for first in range(0, len(points), batch_size):
+                batch = slice(first, first + batch_size)
+                values = block[flat_centers[batch, None] + flat_offsets]
+                measured = _measure_values(values, n_inner)
+                for name, statistic in measured.items():
+                    results[name][points[batch]] = statistic
+
+    if background_radius is None:
+        results["background"][:] = 0
+        results["mass"] = results["sum"].copy()
+    return results
+
+
+def _measure_values(values: np.ndarray, n_inner: int) -> dict[str, np.ndarray]:
+    """Return the statistics of values (n_points, n_offsets), of which the first
+    n_inner columns make up the neighbourhood and the others the background shell.
+    NaN values (outside data) are left out."""
+
+    inside = ~np.isnan(values)
+    values = np.where(inside, values, 0)
+
+    total = values[:, :n_inner].sum(axis=1)
+    count = inside[:, :n_inner].sum(axis=1)
+    maximum = np.where(inside[:, :n_inner], values[:, :n_inner], -np.inf).max(
+        axis=1
+    )
+    # the center voxel always lies within data, so count > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        background = values[:, n_inner:].sum(axis=1) / inside[:, n_inner:].sum(
+            axis=1
+        )
+
+    return {
+        "mean": total / count,
+        "max": maximum,
+        "sum": total,
+        "background": background,
+        "mass": total - background * count,
+    }
@@ -1,10 +1,16 @@
 
+from functools import partial
+
 import napari
+import numpy as np
 import pandas as pd
 from psygnal import Signal
 from qtpy.QtWidgets import QGroupBox, QPushButton, QVBoxLayout, QWidget
+from superqt.utils import qthrottled
 
 from .custom_range_slider_widget import CustomRangeSliderWidget
+from .filtering import RangeFilter
+from .profiling import stage
 
 
 class SelectionWidget(QWidget):
@@ -18,6 +24,11 @@ class SelectionWidget(QWidget):
         self.viewer = viewer
         self.points = None
         self.sliders = []
+        self.df = None
+        self.range_filter = None
+        self._coordinates_array = None
+        # detections of frames that are not shown in the points layer yet
+        self._detected_frames = []
 
         box = QGroupBox("Refine selection")
 
@@ -37,7 +48,54 @@ class SelectionWidget(QWidget):
         layout.addWidget(box)
 
         self.setLayout(layout)
-        self.setMaximumHeight(500)
+        self.setMaximumHeight(800)
+
+    def _start_detection(self, intensity_layer: napari.layers.Image) -> None:
+        """Remove the points and sliders of a previous detection, to make room for the
+        points that are about to be detected in intensity_layer"""
+
+        self.intensity_layer = intensity_layer
+
+        if self.points is not None and self.points in self.viewer.layers:
+            self.viewer.layers.remove(self.points)
+        self.points = None
+
+        self._show_detected_points.cancel()
+        self._detected_frames = []
+
+        self.sliders = []
+        self.range_filter = None
+        self._clear_sliders()
+        self.confirm_btn.setEnabled(False)
+
+    def _add_points(self, df: pd.DataFrame) -> None:
+        """Add newly detected points (e.g. those of a single frame) to the points layer,
+        while the detection is still running"""
+
+        self._detected_frames.append(df)
+        self._show_detected_points()
+
+    @qthrottled(timeout=250)
+    def _show_detected_points(self) -> None:
+        """Add the points detected since the last call to the points layer. Throttled,
+        as setting the layer data copies all points: doing so for every frame of a
+        long time series would take time quadratic in the number of points."""
+
+        frames, self._detected_frames = self._detected_frames, []
+        if not frames:
+            return
+
+        with stage("add points"):
+            if self.points is None:
+                # the first frame creates the layer, also when it has no points
+                self._update_points(frames.pop(0))
+            coordinates = [self._coordinates(df) for df in frames if len(df) > 0]
+            if coordinates:
+                # Layer.add would select the added points, and a selection that is
+                # still there once the layer shrinks on confirmation breaks it.
+                self.points.data = np.concatenate(
+                    [self.points.data, *coordinates]
+                )
 
     def _update_points_and_sliders(
         self, df: pd.DataFrame, intensity_layer: napari.layers.Image
@@ -45,14 +103,14 @@ class SelectionWidget(QWidget):
         """Initializes the points layer based on the detection dataframe, and the sliders for filtering"""
 
         self.df = df
-        self.filtered_df = df
         self.intensity_layer = intensity_layer
 
-        if self.points is not None and self.points in self.viewer.layers:
-            self.viewer.layers.remove(self.points)
-        self.points = None
-
-        self._update_points(df)
+        # reuses the layer that the points were added to during detection, which gets
+        # all points at once
+        self._show_detected_points.cancel()
+        self._detected_frames = []
+        with stage("update points"):
+            self._update_points(df)
 
         filter_properties = [
             {
@@ -83,6 +141,11 @@ class SelectionWidget(QWidget):
 
         # Create a range slider widget for each of the properties.
         self.sliders = []
+        with stage("sort filter properties"):
+            self.range_filter = RangeFilter(
+                df, [prop["name"] for prop in filter_properties if prop["name"] in df]
+            )
+        self._coordinates_array = self._coordinates(df)
         for prop in filter_properties:
             if prop["name"] in self.df.columns:
                 slider_widget = CustomRangeSliderWidget(
@@ -94,47 +157,69 @@ class SelectionWidget(QWidget):
                 )
                 # Connect filtering of object to change in value of the range slider.
                 slider_widget.range_slider._slider.valueChanged.connect(
-                    lambda: self._filter_objects(self.df)
+                    partial(self._update_range, slider_widget)
                 )
                 slider_widget.range_slider._slider.rangeChanged.connect(
-                    lambda: self._filter_objects(self.df)
+                    partial(self._update_range, slider_widget)
                 )
-                slider_widget.setMinimumHeight(100)
+                # the points are not filtered on the initial (full) range, until a
+                # slider is moved
+                slider_widget.setMinimumHeight(160)
                 self.sliders.append(slider_widget)
 
         # remove any old sliders if there are any
-        for i in reversed(range(self.sliders_layout.count())):
-            self.sliders_layout.itemAt(i).widget().deleteLater()
+        self._clear_sliders()
         # add the new sliders
         for slider_widget in self.sliders:
             self.sliders_layout.addWidget(slider_widget)
 
         self.confirm_btn.setEnabled(True)
 
-    def _filter_objects(self, df: pd.DataFrame):
-        """Filter the data in the points layer based on the slider settings"""
+    def _clear_sliders(self) -> None:
+        """Remove the slider widgets from the layout"""
 
-        masks = []
-        for slider in self.sliders:
-            # Create a mask for for each of the slider settings.
-            prop = slider.name
-            value = slider.range_slider._slider.value()
-            mask = (df[prop] >= value[0]) & (df[prop] <= value[1])
-            masks.append(mask)
+        for i in reversed(range(self.sliders_layout.count())):
+            self.sliders_layout.itemAt(i).widget().deleteLater()
 
-        # Combine all masks.
-        combined_mask = pd.Series(True, index=df.index)
-        for mask in masks:
-            combined_mask &= mask
+    @property
+    def filtered_df(self) -> pd.DataFrame | None:
+        """The detections within the ranges of all sliders"""
 
-        # Select the rows that satisfy all the criteria.
-        self.filtered_df = df[combined_mask]
+        if self.range_filter is None:
+            return self.df
+        return self.df[self.range_filter.mask]
 
-        # Update the points.
-        self._update_points(self.filtered_df)
+    def _update_range(self, slider: CustomRangeSliderWidget, *args) -> None:
+        """Update the range of the property of the slider that changed, and schedule
+        updating the points"""
 
-    def _update_points(self, df: pd.DataFrame) -> None:
-        """Create a point layer from a pandas dataframe"""
+        qslider = slider.range_slider._slider
+        low, high = qslider.value()
+        if low <= qslider.minimum() and high >= qslider.maximum():
+            # a slider at its full range excludes nothing, not even points without a
+            # value for its property
+            self.range_filter.clear_range(slider.name)
+        else:
+            self.range_filter.set_range(slider.name, low, high)
+        self._filter_objects()
+
+    @qthrottled(timeout=16)
+    def _filter_objects(self) -> None:
+        """Show only the points within the slider settings. Throttled to about the
+        display frame rate, as sliders change much more often while dragging.
+
+        The layer keeps all detections while filtering, only which of them are shown
+        changes. The layer data is reduced to the shown points on confirmation.
+        """
+
+        if self.points is None or self.range_filter is None:
+            return
+
+        with stage("filter"):
+            self.points.shown = self.range_filter.mask
+
+    def _coordinates(self, df: pd.DataFrame) -> np.ndarray:
+        """Return the point coordinates in a pandas dataframe as (t)(z)yx array"""
 
         # Check which columns are present in the dataframe
         columns = df.columns
@@ -156,21 +241,39 @@ class SelectionWidget(QWidget):
             coordinates_array = coordinates_df.to_numpy()
 
         # Reshape the array based on the number of dimensions
-        coordinates = coordinates_array.reshape(-1, coordinates_array.shape[1])
+        return coordinates_array.reshape(-1, coordinates_array.shape[1])
+
+    def _update_points(self, df: pd.DataFrame) -> None:
+        """Create a point layer from a pandas dataframe"""
+
+        coordinates = self._coordinates(df)
 
         # Create or update the points layer
         if self.points is None:
+            # Axes of length 1 are left out for detection, so the points only span the
+            # other axes of the image.
+            kept_axes = np.asarray(self.intensity_layer.data.shape) != 1
             self.points = self.viewer.add_points(
                 name="Detected objects",
                 data=coordinates,
                 face_color="magenta",
                 opacity=0.5,
-                scale=self.intensity_layer.scale,
+                scale=np.asarray(self.intensity_layer.scale)[kept_axes],
             )
         else:
             self.points.data = coordinates
 
     def _confirm_points(self):
+        # keep only the points within the slider settings
+        self._filter_objects.cancel()
+        if self.range_filter is not None:
+            mask = self.range_filter.mask
+            if not mask.all():
+                # points selected in the meantime may no longer exist
+                self.points.selected_data = set()
+                self.points.data = self._coordinates_array[mask]
+            self.points.shown = True
+
         self.points.face_color = 'red'
         self.points.current_face_color = 'red'
         self.points.out_of_slice_display = True
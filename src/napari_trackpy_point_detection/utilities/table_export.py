@@ -0,0 +1,156 @@
+import csv
+import gzip
+import io
+import os
+from collections.abc import Iterator
+from pathlib import Path
+from typing import BinaryIO
+
+import pandas as pd
+
+# file dialog filter per export format
+EXPORT_FORMATS = {
+    "csv": "CSV (*.csv)",
+    "csv.gz": "Compressed CSV (*.csv.gz)",
+    "parquet": "Parquet (*.parquet)",
+    "feather": "Feather (*.feather)",
+}
+
+
+def export_format(path: str | Path) -> str:
+    """Return the export format for the extension of path, or raise a ValueError if
+    it has none of the EXPORT_FORMATS"""
+
+    name = Path(path).name.lower()
+    # longest first, so that .csv.gz is not taken for .csv
+    for fmt in sorted(EXPORT_FORMATS, key=len, reverse=True):
+        if name.endswith(f".{fmt}"):
+            return fmt
+    raise ValueError(
+        f"Cannot save '{name}': use one of the extensions "
+        + ", ".join(f".{fmt}" for fmt in EXPORT_FORMATS)
+    )
+
+
+def iter_export(
+    df: pd.DataFrame, path: str | Path, chunk_size: int = 100_000
+) -> Iterator[int]:
+    """Write df to path in chunks of chunk_size rows, in the format given by the
+    extension of path (see EXPORT_FORMATS), and yield the number of rows written
+    after each chunk.
+
+    The chunks are views on df, so the table is not copied. The rows are written to
+    a temporary file, which only replaces path once all rows are written: closing
+    the generator early (e.g. to cancel the export) leaves path untouched. CSV files
+    keep the index as first column, Parquet and Feather files only the columns.
+    """
+
+    path = Path(path)
+    fmt = export_format(path)
+    if fmt in ("parquet", "feather"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError(
+                f"Saving as {fmt} requires pyarrow: pip install pyarrow"
+            ) from e
+
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    chunks = (
+        df.iloc[start : start + chunk_size]
+        for start in range(0, max(len(df), 1), chunk_size)
+    )
+    try:
+        if fmt in ("csv", "csv.gz"):
+            yield from _write_csv(chunks, tmp, compress=fmt == "csv.gz")
+        else:
+            yield from _write_arrow(chunks, tmp, fmt)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _write_csv(
+    chunks: Iterator[pd.DataFrame], path: Path, compress: bool
+) -> Iterator[int]:
+    """Write the chunks as (gzip compressed) CSV, with pyarrow's much faster CSV
+    writer if it is installed"""
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        arrow = False
+    else:
+        arrow = True
+
+    # The fastest compression level: higher levels take several times longer, but
+    # hardly shrink a table of numbers any further.
+    with (
+        gzip.open(path, "wb", compresslevel=1) if compress else open(path, "wb")
+    ) as f:
+        if arrow:
+            yield from _write_arrow(chunks, f, "csv", index=True)
+            return
+
+        n_rows = 0
+        for chunk in chunks:
+            chunk.to_csv(f, header=n_rows == 0, mode="wb")
+            n_rows += len(chunk)
+            yield n_rows
+
+
+def _write_arrow(
+    chunks: Iterator[pd.DataFrame],
+    sink: Path | BinaryIO,
+    fmt: str,
+    index: bool = False,
+) -> Iterator[int]:
+    """Write the chunks as Parquet, Feather or CSV with pyarrow. With index, the
+    index is written as first (unnamed) column, as pandas does."""
+
+    import pyarrow as pa
+
+    n_rows = 0
+    schema = None
+    writer = None
+    try:
+        for chunk in chunks:
+            # the first chunk fixes the types, e.g. of columns that are all missing
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            schema = table.schema
+            if index:
+                table = table.add_column(0, "", pa.array(chunk.index))
+            if writer is None:
+                writer = _arrow_writer(sink, table.schema, fmt)
+            writer.write_table(table)
+            n_rows += len(chunk)
+            yield n_rows
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _arrow_writer(sink: Path | BinaryIO, schema, fmt: str):
+    """Open a Parquet, Feather or CSV file for writing tables with schema"""
+
+    import pyarrow as pa
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetWriter(sink, schema)
+
+    if fmt == "csv":
+        import pyarrow.csv
+
+        # pyarrow quotes every column name, so the header is written as pandas does
+        header = io.StringIO()
+        csv.writer(header, lineterminator="\n").writerow(schema.names)
+        sink.write(header.getvalue().encode())
+        options = pyarrow.csv.WriteOptions(include_header=False)
+        return pyarrow.csv.CSVWriter(sink, schema, write_options=options)
+
+    # Feather (version 2) is the Arrow IPC file format, compressed like
+    # pyarrow.feather.write_feather does by default
+    options = pa.ipc.IpcWriteOptions(compression="lz4")
+    return pa.ipc.new_file(sink, schema, options=options)
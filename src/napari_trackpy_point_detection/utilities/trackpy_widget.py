@@ -1,52 +1,51 @@
+import time
 import warnings
+from collections.abc import Iterator
+from pathlib import Path
 
-import dask.array as da
 import napari
 import numpy as np
 import pandas as pd
-import trackpy
 from napari.layers import Image
+from napari.qt.threading import thread_worker
+from napari.utils.notifications import show_error
 from psygnal import Signal
+from qtpy.QtCore import QTimer
 from qtpy.QtWidgets import (
     QCheckBox,
     QDoubleSpinBox,
+    QFileDialog,
     QGroupBox,
     QHBoxLayout,
     QLabel,
     QMessageBox,
+    QProgressBar,
     QPushButton,
     QSpinBox,
     QVBoxLayout,
     QWidget,
 )
-from scipy.ndimage import gaussian_filter
 
+from .detection import (
+    DetectionParameters,
+    available_workers,
+    detect,
+    detect_frame,
+    is_time_series,
+    iter_detect,
+    squeeze,
+)
+from .frame_cache import FrameCache
 from .layer_dropdown import LayerDropdown
+from .profiling import stage
+from .result_store import ResultStore, iter_detect_stored
 
 
-def downsample_and_blur(img: np.ndarray, factors: list[int], sigmas:list[int]) -> np.ndarray:
-    """Bin and apply gaussian filter"""
-
-    if not all(f == 1 for f in factors):
-        cropped_shape = tuple((s // factors[i]) * factors[i] for i, s in enumerate(img.shape))
-        slices = tuple(slice(0, s) for s in cropped_shape)
-        img = img[slices]
-
-        reshaped_shape = []
-        for i, s in enumerate(cropped_shape):
-            reshaped_shape.extend([s // factors[i], factors[i]])
-
-        reshaped = img.reshape(reshaped_shape)
-        img = reshaped.mean(axis=tuple(range(1, len(reshaped_shape), 2)))
-
-    if not all(s == 1 for s in sigmas):
-        img = gaussian_filter(img, sigmas)
-
-    return img
-
 class TrackpyWidget(QWidget):
     """Widget for running detection with trackpy on an open image"""
 
+    detection_started = Signal()
+    frame_detected = Signal(object)
     points_detected = Signal()
 
     def __init__(self, viewer: napari.Viewer):
@@ -55,6 +54,21 @@ class TrackpyWidget(QWidget):
 
         self.intensity_layer = None
         self.df = None
+        self._worker = None
+        self._detection = None
+        self._preview_worker = None
+        self._preview_pending = False
+        self.preview_layer = None
+
+        # preprocessed frames, per layer and version of its data
+        self.frame_cache = FrameCache(max_bytes=2048 * 1024**2)
+        self._data_versions = {}
+
+        # detections stored on disk, if enabled
+        self.result_store = None
+        self.store_directory = (
+            Path.home() / ".cache" / "napari-trackpy-point-detection"
+        )
 
         self.use_z = False
 
@@ -233,11 +247,139 @@ class TrackpyWidget(QWidget):
 
         downsample_settings.setLayout(downsample_settings_layout)
 
+        # Spread the frames of a time series over multiple processes
+        parallel_settings = QGroupBox("Parallel processing")
+        parallel_settings.setToolTip("Number of worker processes over which the time points are divided. A value of 1 will detect the time points one after the other.")
+        parallel_settings_layout = QHBoxLayout()
+        workers_label = QLabel("Workers")
+        self.workers_spinbox = QSpinBox()
+        self.workers_spinbox.setMinimum(1)
+        self.workers_spinbox.setMaximum(available_workers())
+        self.workers_spinbox.setValue(1)
+        parallel_settings_layout.addWidget(workers_label)
+        parallel_settings_layout.addWidget(self.workers_spinbox)
+        parallel_settings.setLayout(parallel_settings_layout)
+
+        # Process large images in overlapping tiles, so that they need not fit in memory
+        tile_settings = QGroupBox("Tiled processing")
+        tile_settings.setToolTip("Detect objects in overlapping tiles of (at most) this many pixels per axis, so that only a few tiles have to be in memory at the same time. Useful for images that are too large to fit in memory, preferably with a tile size that is a multiple of the chunk size of the image. As the intensity threshold is computed per tile, the dimmest objects that are found can differ from those found without tiles.")
+        tile_settings_layout = QHBoxLayout()
+        self.tile_cb = QCheckBox("Use tiles")
+        self.tile_cb.setChecked(False)
+        self.tile_spinbox = QSpinBox()
+        self.tile_spinbox.setMinimum(64)
+        self.tile_spinbox.setMaximum(8192)
+        self.tile_spinbox.setSingleStep(64)
+        self.tile_spinbox.setValue(512)
+        self.tile_spinbox.setEnabled(False)
+        self.tile_cb.toggled.connect(self.tile_spinbox.setEnabled)
+        tile_settings_layout.addWidget(self.tile_cb)
+        tile_settings_layout.addWidget(self.tile_spinbox)
+        tile_settings.setLayout(tile_settings_layout)
+
+        # Keep downsampled and blurred frames, for fast reruns with other settings
+        cache_settings = QGroupBox("Cache preprocessed frames")
+        cache_settings.setToolTip("Keep the downsampled and blurred frames in memory, so that detecting again with another diameter, separation or percentile (but the same downsampling and blur) does not have to preprocess them again. Frames that do not fit in memory can be moved to disk instead of being dropped.")
+        cache_settings_layout = QHBoxLayout()
+        cache_label = QLabel("Memory (MB)")
+        self.cache_spinbox = QSpinBox()
+        self.cache_spinbox.setMinimum(0)
+        self.cache_spinbox.setMaximum(1024 * 1024)
+        self.cache_spinbox.setSingleStep(256)
+        self.cache_spinbox.setValue(2048)
+        self.cache_spinbox.setToolTip("Memory available for cached frames. A value of 0 will not cache any frames.")
+        self.cache_spinbox.valueChanged.connect(self._resize_cache)
+        self.spill_cb = QCheckBox("Spill to disk")
+        self.spill_cb.setChecked(False)
+        self.spill_cb.toggled.connect(self._toggle_spill)
+        cache_settings_layout.addWidget(cache_label)
+        cache_settings_layout.addWidget(self.cache_spinbox)
+        cache_settings_layout.addWidget(self.spill_cb)
+        cache_settings.setLayout(cache_settings_layout)
+
+        # Store detections on disk, so that rerunning with the same settings loads them
+        store_settings = QGroupBox("Store results")
+        store_settings.setToolTip("Keep the detections on disk, per image and detection settings, so that detecting again with the same settings (also in a later session) loads them instead. Each frame is stored as soon as it is done, so that an interrupted run resumes where it left off.")
+        store_settings_layout = QVBoxLayout()
+        self.store_cb = QCheckBox("Store results on disk")
+        self.store_cb.setChecked(False)
+        self.store_cb.toggled.connect(self._toggle_store)
+        self.store_dir_label = QLabel(str(self.store_directory))
+        self.store_dir_label.setWordWrap(True)
+        self.store_dir_btn = QPushButton("Choose folder")
+        self.store_dir_btn.clicked.connect(self._choose_store_directory)
+        store_dir_layout = QHBoxLayout()
+        store_dir_layout.addWidget(self.store_dir_label)
+        store_dir_layout.addWidget(self.store_dir_btn)
+        store_dir_layout.setContentsMargins(0, 0, 0, 0)
+        store_settings_layout.addWidget(self.store_cb)
+        store_settings_layout.addLayout(store_dir_layout)
+        store_settings.setLayout(store_settings_layout)
+
+        # Preview the detection on the current frame, rerun whenever a setting changes
+        preview_settings = QGroupBox("Preview")
+        preview_settings.setToolTip("Detect objects in the current frame only (optionally only in the visible part of it), to quickly try out settings. The preview is updated whenever a setting changes, the points are not kept.")
+        preview_settings_layout = QHBoxLayout()
+        self.preview_cb = QCheckBox("Preview current frame")
+        self.preview_cb.setChecked(False)
+        self.preview_cb.toggled.connect(self._toggle_preview)
+        self.preview_region_cb = QCheckBox("Visible region only")
+        self.preview_region_cb.setChecked(False)
+        self.preview_region_cb.setEnabled(False)
+        self.preview_region_cb.toggled.connect(self._schedule_preview)
+        self.preview_cb.toggled.connect(self.preview_region_cb.setEnabled)
+        preview_settings_layout.addWidget(self.preview_cb)
+        preview_settings_layout.addWidget(self.preview_region_cb)
+        preview_settings.setLayout(preview_settings_layout)
+
+        # wait for the user to stop changing settings before updating the preview
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.setInterval(300)
+        self._preview_timer.timeout.connect(self._preview)
+
+        for spinbox in (
+            self.diameter_spinbox_xy,
+            self.diameter_spinbox_z,
+            self.separation_spinbox_xy,
+            self.separation_spinbox_z,
+            self.percentile_spinbox,
+            self.xy_downsample,
+            self.z_downsample,
+            self.xy_sigma,
+            self.z_sigma,
+        ):
+            spinbox.valueChanged.connect(self._schedule_preview)
+        self.z_dim_cb.stateChanged.connect(self._schedule_preview)
+        self.viewer.dims.events.current_step.connect(self._schedule_preview)
+        self.viewer.camera.events.center.connect(self._on_camera_changed)
+        self.viewer.camera.events.zoom.connect(self._on_camera_changed)
+
         # button to start detecting
-        self.detect_trackpy_btn = QPushButton("Detect objects")
+        self.detect_trackpy_btn = QPushButton("Detect all")
         self.detect_trackpy_btn.clicked.connect(self._run)
         self.detect_trackpy_btn.setEnabled(False)
 
+        # progress of a running detection, with the option to cancel it
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("%v / %m frames")
+        self.progress_label = QLabel()
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.clicked.connect(self._cancel)
+        self.cancel_btn.setEnabled(False)
+
+        progress_layout = QHBoxLayout()
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.cancel_btn)
+        progress_layout.setContentsMargins(0, 0, 0, 0)
+        progress_widget_layout = QVBoxLayout()
+        progress_widget_layout.addLayout(progress_layout)
+        progress_widget_layout.addWidget(self.progress_label)
+        progress_widget_layout.setContentsMargins(0, 0, 0, 0)
+        self.progress_widget = QWidget()
+        self.progress_widget.setLayout(progress_widget_layout)
+        self.progress_widget.setVisible(False)
+
         # combine all settings
         settings_layout = QVBoxLayout()
         settings_layout.addWidget(self.layer_dropdown)
@@ -246,7 +388,13 @@ class TrackpyWidget(QWidget):
         settings_layout.addWidget(separation_settings)
         settings_layout.addWidget(percentile_settings)
         settings_layout.addWidget(downsample_settings)
+        settings_layout.addWidget(parallel_settings)
+        settings_layout.addWidget(tile_settings)
+        settings_layout.addWidget(cache_settings)
+        settings_layout.addWidget(store_settings)
+        settings_layout.addWidget(preview_settings)
         settings_layout.addWidget(self.detect_trackpy_btn)
+        settings_layout.addWidget(self.progress_widget)
 
         self.setLayout(settings_layout)
         self.setMaximumHeight(1100)
@@ -284,19 +432,77 @@ class TrackpyWidget(QWidget):
         else:
             self.intensity_layer = self.viewer.layers[selected_layer]
             self.layer_dropdown.setCurrentText(selected_layer)
+            if self.intensity_layer.unique_id not in self._data_versions:
+                self._data_versions[self.intensity_layer.unique_id] = 0
+                self.intensity_layer.events.data.connect(self._on_data_changed)
 
-        if self.intensity_layer is None:
+        if self.intensity_layer is None or self._worker is not None:
             self.detect_trackpy_btn.setEnabled(False)
         else:
             self.detect_trackpy_btn.setEnabled(True)
 
         self._check_dimensions()
+        self._remove_preview()
+        self._schedule_preview()
+
+    def _on_data_changed(self, event) -> None:
+        """Keep track of changes to the data of a layer, so that frames cached for
+        previous versions of the data are no longer used."""
+
+        self._data_versions[event.source.unique_id] += 1
+        if event.source is self.intensity_layer:
+            self._schedule_preview()
+
+    def _image_key(self) -> tuple[str, int]:
+        """Identify the data of the selected layer in the frame cache"""
+
+        layer_id = self.intensity_layer.unique_id
+        return layer_id, self._data_versions[layer_id]
+
+    def _image_source(self) -> str | None:
+        """Path of the file that the selected layer was read from, if any"""
+
+        path = self.intensity_layer.source.path
+        return None if path is None else str(path)
+
+    def _resize_cache(self, megabytes: int) -> None:
+        """Change the memory available for cached frames"""
+
+        self.frame_cache.resize(megabytes * 1024**2)
+
+    def _toggle_spill(self, spill: bool) -> None:
+        """Move the cached frames that do not fit in memory to disk, or drop them"""
+
+        self.frame_cache.spill_to_disk = spill
+
+    def _toggle_store(self, store: bool) -> None:
+        """Start or stop storing detections on disk"""
+
+        self.result_store = None
+        if store:
+            try:
+                self.result_store = ResultStore(self.store_directory)
+            except ImportError as e:
+                show_error(str(e))
+                self.store_cb.setChecked(False)
+
+    def _choose_store_directory(self) -> None:
+        """Select the folder in which detections are stored"""
+
+        directory = QFileDialog.getExistingDirectory(
+            self, "Store results in", str(self.store_directory)
+        )
+        if directory:
+            self.store_directory = Path(directory)
+            self.store_dir_label.setText(directory)
+            self._toggle_store(self.store_cb.isChecked())
 
     def _check_dimensions(self) -> None:
         """Checks the dimensions of the selected image to know whether to do detection in 2D or 3D"""
 
         if self.intensity_layer is not None:
-            shape = self.intensity_layer.data.shape
+            # axes of length 1 are ignored for detection
+            shape = [s for s in self.intensity_layer.data.shape if s != 1]
             if len(shape) == 2:  # 2D, force deactivate the z dimension
                 self.use_z = False
                 self.z_dim_cb.setEnabled(False)
@@ -307,34 +513,130 @@ class TrackpyWidget(QWidget):
                 self.z_dim_cb.setEnabled(True)
 
     def _run(self) -> None:
-        """Run detection"""
+        """Run detection in a background thread, so that the viewer stays responsive.
+        The points of each frame are passed on as soon as that frame is done."""
+
+        img = self._image()
+        params = self._detection_parameters(img)
+        if params is None:
+            return
 
-        self.df = self._detect()
+        self._preview_timer.stop()
+        self._preview_pending = False
+        self._remove_preview()
+
+        self._n_frames = img.shape[0] if is_time_series(img, params.use_z) else 1
+        self._detected_frames = []
+        self._start_time = time.perf_counter()
+
+        self.detect_trackpy_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.progress_bar.setMaximum(self._n_frames)
+        self.progress_bar.setValue(0)
+        self.progress_label.setText("")
+        self.progress_widget.setVisible(True)
+        self.detection_started.emit()
+
+        if self.result_store is None:
+            self._detection = iter_detect(
+                img, params, self.frame_cache, self._image_key()
+            )
+        else:
+            self._detection = iter_detect_stored(
+                img,
+                params,
+                self.result_store,
+                self._image_source(),
+                self.frame_cache,
+                self._image_key(),
+            )
+        self._worker = _stream(self._detection)
+        self._worker.yielded.connect(self._on_frame_detected)
+        self._worker.errored.connect(self._on_detection_error)
+        self._worker.finished.connect(self._on_detection_finished)
+        self._worker.start()
+
+    def _cancel(self) -> None:
+        """Stop the running detection after the frame(s) currently being processed"""
+
+        if self._worker is not None:
+            self.cancel_btn.setEnabled(False)
+            self.progress_label.setText("Cancelling...")
+            self._worker.quit()
+
+    def _on_frame_detected(self, d_t: pd.DataFrame) -> None:
+        """Keep the detections of a finished frame and report the progress"""
+
+        self._detected_frames.append(d_t)
+        self.frame_detected.emit(d_t)
+
+        n_done = len(self._detected_frames)
+        self.progress_bar.setValue(n_done)
+        if n_done < self._n_frames:
+            elapsed = time.perf_counter() - self._start_time
+            remaining = elapsed / n_done * (self._n_frames - n_done)
+            self.progress_label.setText(f"About {_format_duration(remaining)} left")
+
+    def _on_detection_error(self, error: Exception) -> None:
+        """Inform the user that detection failed. As when detection is cancelled, the
+        points of the frames detected so far are kept (and already shown), so they get
+        their sliders once the worker has finished."""
+
+        message = f"Detection failed: {error}"
+        if self._detected_frames:
+            message += (
+                f" The points of the first {len(self._detected_frames)} frame(s)"
+                " are kept."
+            )
+        show_error(message)
+
+    def _on_detection_finished(self) -> None:
+        """Combine the detections of all (or, when cancelled, all finished) frames"""
+
+        # stops the worker processes when detection was cancelled or failed
+        self._detection.close()
+        self._worker = None
+        self.detect_trackpy_btn.setEnabled(self.intensity_layer is not None)
+        self.cancel_btn.setEnabled(False)
+        self.progress_widget.setVisible(False)
+
+        if not self._detected_frames:
+            return
+
+        with stage("concat"):
+            self.df = pd.concat(self._detected_frames, ignore_index=True)
+        self._detected_frames = []
         self.points_detected.emit()
         if self.viewer.dims.ndim > 2:
             self.viewer.dims.ndisplay = 3
 
+    def _image(self) -> np.ndarray:
+        """Return the data of the selected layer without its axes of length 1.
 
-    def _detect(self) -> pd.DataFrame:
-        """Load the image data, and run trackpy.locate to detect objects"""
+        This is a view on (or, for e.g. zarr arrays, a lazy dask array over) the layer
+        data: the layer itself is left untouched, so that it does not have to be
+        refreshed and its data is not loaded or copied.
+        """
 
-        self.intensity_layer.data = np.squeeze(self.intensity_layer.data)
+        return squeeze(self.intensity_layer.data)
 
-        if not (
-            len(self.intensity_layer.data.shape) >= 2
-            and len(self.intensity_layer.data.shape) <= 4
-        ):
+    def _detection_parameters(
+        self, img: np.ndarray
+    ) -> DetectionParameters | None:
+        """Read the detection parameters for img from the widgets. Returns None, after
+        informing the user, when the image cannot be used."""
+
+        if not (len(img.shape) >= 2 and len(img.shape) <= 4):
             msg = QMessageBox()
             msg.setWindowTitle("Invalid dimensions")
             msg.setText(
-                "Please select an image that has 2-4 dimensions (x, y, (z), (t)). Current image has",
-                str(len(self.intensity_layer.data.shape)),
-                "dimensions.",
+                "Please select an image that has 2-4 dimensions (x, y, (z), (t)). "
+                f"Current image has {len(img.shape)} dimensions."
             )
             msg.setIcon(QMessageBox.Information)
             msg.setStandardButtons(QMessageBox.Ok)
             msg.exec_()
-            return
+            return None
 
         # make sure that odd integers are used
         value_xy = self.diameter_spinbox_xy.value()
@@ -346,64 +648,195 @@ class TrackpyWidget(QWidget):
             self.diameter_spinbox_z.setValue(value_z + 1)
             warnings.warn("Updated value to next odd integer", stacklevel=2)
 
-        xy_downsample = self.xy_downsample.value()
-        z_downsample = self.z_downsample.value()
-        xy_diameter = int(self.diameter_spinbox_xy.value() / xy_downsample) | 1
-        z_diameter = int(self.diameter_spinbox_z.value() / z_downsample) | 1
-        xy_separation = self.separation_spinbox_xy.value() / xy_downsample
-        z_separation = self.separation_spinbox_z.value() / z_downsample
-        xy_sigma = self.xy_sigma.value()
-        z_sigma = self.z_sigma.value()
-        percentile=self.percentile_spinbox.value()
-
-        img = self.intensity_layer.data
-
-        diameter = [xy_diameter, xy_diameter]
-        separation = [xy_separation, xy_separation]
-        downsample = [xy_downsample, xy_downsample]
-        sigmas = [xy_sigma, xy_sigma]
-        if self.use_z:
-            diameter.insert(0, z_diameter)
-            separation.insert(0, z_separation)
-            downsample.insert(0, z_downsample)
-            sigmas.insert(0, z_sigma)
-
-        # single image
-        if img.ndim == 2 or (img.ndim == 3 and self.use_z):
-            img = downsample_and_blur(img, downsample, sigmas)
-            d = trackpy.locate(
-                img,
-                diameter=diameter,
-                separation=separation,
-                percentile=percentile
-            )
+        return self._read_parameters(img)
+
+    def _read_parameters(self, img: np.ndarray) -> DetectionParameters:
+        """Read the detection parameters for img from the widgets as they are"""
+
+        return DetectionParameters(
+            diameter_xy=self.diameter_spinbox_xy.value(),
+            diameter_z=self.diameter_spinbox_z.value(),
+            separation_xy=self.separation_spinbox_xy.value(),
+            separation_z=self.separation_spinbox_z.value(),
+            percentile=self.percentile_spinbox.value(),
+            downsample_xy=self.xy_downsample.value(),
+            downsample_z=self.z_downsample.value(),
+            sigma_xy=self.xy_sigma.value(),
+            sigma_z=self.z_sigma.value(),
+            use_z=self.use_z,
+            n_workers=self.workers_spinbox.value(),
+            tile_size=self.tile_spinbox.value() if self.tile_cb.isChecked() else 0,
+        ).for_image(img)
+
+    def _detect(self) -> pd.DataFrame:
+        """Load the image data, and run trackpy.locate to detect objects"""
+
+        img = self._image()
+        params = self._detection_parameters(img)
+        if params is None:
+            return None
+
+        return detect(img, params, self.frame_cache, self._image_key())
+
+    def _toggle_preview(self, preview: bool) -> None:
+        """Start previewing the detection on the current frame, or remove the preview"""
+
+        if preview:
+            self._schedule_preview()
+        else:
+            self._preview_timer.stop()
+            self._preview_pending = False
+            self._remove_preview()
+
+    def _schedule_preview(self, *args) -> None:
+        """Update the preview once the settings (or the current frame) have not changed
+        for a moment, instead of for every step of a spinbox."""
+
+        if self.preview_cb.isChecked() and self.intensity_layer is not None:
+            self._preview_timer.start()
+
+    def _on_camera_changed(self, event) -> None:
+        """Update the preview of the visible region after panning or zooming"""
+
+        if self.preview_region_cb.isChecked():
+            self._schedule_preview()
+
+    def _preview(self) -> None:
+        """Detect objects in the current frame in a background thread, to show them in
+        the preview layer"""
+
+        if self.intensity_layer is None or self._worker is not None:
+            return
+        if self._preview_worker is not None:
+            # rerun with the latest settings once the running preview is done
+            self._preview_pending = True
+            return
 
-        # looping over the first dimensions
+        img = self._image()
+        if not (len(img.shape) >= 2 and len(img.shape) <= 4):
+            return
+        params = self._read_parameters(img).for_image(img)
+        region = None
+        if self.preview_region_cb.isChecked():
+            region = self._visible_region(img, params)
+
+        self._preview_worker = _detect_frame(
+            img,
+            params,
+            self._current_frame(img, params),
+            region,
+            self.frame_cache,
+            self._image_key(),
+        )
+        self._preview_worker.returned.connect(self._show_preview)
+        self._preview_worker.errored.connect(self._on_preview_error)
+        self._preview_worker.finished.connect(self._on_preview_finished)
+        self._preview_worker.start()
+
+    def _current_frame(
+        self, img: np.ndarray, params: DetectionParameters
+    ) -> int:
+        """Index of the frame of img that is shown in the viewer"""
+
+        if not is_time_series(img, params.use_z):
+            return 0
+
+        position = self.intensity_layer.world_to_data(self.viewer.dims.point)
+        kept_axes = np.asarray(self.intensity_layer.data.shape) != 1
+        t = int(round(np.asarray(position)[kept_axes][0]))
+        return min(max(t, 0), img.shape[0] - 1)
+
+    def _visible_region(
+        self, img: np.ndarray, params: DetectionParameters
+    ) -> tuple[slice, ...] | None:
+        """The (z)yx slices of img that are visible on the canvas, or None if the whole
+        frame is visible (or nothing is)."""
+
+        kept_axes = np.asarray(self.intensity_layer.data.shape) != 1
+        corners = np.asarray(self.intensity_layer.corner_pixels)[:, kept_axes]
+        if is_time_series(img, params.use_z):
+            corners = corners[:, 1:]
+
+        region = tuple(
+            slice(int(start), int(stop) + 1) for start, stop in corners.T
+        )
+        if any(s.stop - s.start < 2 for s in region):
+            return None
+        return region
+
+    def _show_preview(self, df: pd.DataFrame) -> None:
+        """Show the detections of the preview in a temporary points layer"""
+
+        if not self.preview_cb.isChecked() or self._worker is not None:
+            return
+
+        columns = [c for c in ("t", "z", "y", "x") if c in df.columns]
+        coordinates = df[columns].to_numpy()
+        if self.preview_layer is None or self.preview_layer not in self.viewer.layers:
+            # the points span the axes of the image that are used for detection
+            kept_axes = np.asarray(self.intensity_layer.data.shape) != 1
+            self.preview_layer = self.viewer.add_points(
+                name="Detection preview",
+                data=coordinates,
+                face_color="yellow",
+                opacity=0.5,
+                scale=np.asarray(self.intensity_layer.scale)[kept_axes],
+            )
+            # keep the layer that is being previewed selected
+            self.viewer.layers.selection.active = self.intensity_layer
         else:
-            d = []
-            for t in range(img.shape[0]):
-                if isinstance(img, da.core.Array):
-                    img_t = img[t].compute()
-                else:
-                    img_t = img[t]
-
-                img_t = downsample_and_blur(img_t, downsample, sigmas)
-                d_t = trackpy.locate(
-                    img_t,
-                    diameter=diameter,
-                    separation=separation,
-                    percentile=percentile
-                )
-                d_t["t"] = t
-                d.append(d_t)
-            d = pd.concat(d, ignore_index=True)
-
-        d = d.round(3)
-        d['x'] = d['x'] * downsample[-1]
-        d['y'] = d['y'] * downsample[-2]
-        if self.use_z:
-            d['z'] = d['z'] * downsample[-3]
-
-        return d
+            self.preview_layer.data = coordinates
+
+    def _on_preview_error(self, error: Exception) -> None:
+        """Inform the user that the preview failed"""
+
+        show_error(f"Preview failed: {error}")
+
+    def _on_preview_finished(self) -> None:
+        """Run the preview again if the settings changed while it was running"""
+
+        self._preview_worker = None
+        if self._preview_pending:
+            self._preview_pending = False
+            self._preview()
+
+    def _remove_preview(self) -> None:
+        """Remove the preview layer from the viewer"""
+
+        if self.preview_layer is not None and self.preview_layer in self.viewer.layers:
+            self.viewer.layers.remove(self.preview_layer)
+        self.preview_layer = None
+
+
+@thread_worker(start_thread=False)
+def _detect_frame(
+    img: np.ndarray,
+    params: DetectionParameters,
+    t: int,
+    region: tuple[slice, ...] | None,
+    cache: FrameCache,
+    image_key: tuple[str, int],
+) -> pd.DataFrame:
+    """Detect objects in a single frame of img in a background thread"""
+
+    return detect_frame(img, params, t, region, cache, image_key)
+
+
+@thread_worker(start_thread=False)
+def _stream(frames: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """Run the detection of the frames in a background thread, one frame at a time"""
+
+    yield from frames
+
 
+def _format_duration(seconds: float) -> str:
+    """Format a duration as e.g. '1 h 5 min', '3 min 20 s' or '12 s'"""
 
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours} h {minutes} min"
+    if minutes:
+        return f"{minutes} min {seconds} s"
+    return f"{seconds} s"
@@ -1,6 +1,7 @@
 import copy
 
 import napari
+import pandas as pd
 from napari_plane_sliders import PlaneSliderWidget
 from qtpy.QtWidgets import (
     QGroupBox,
@@ -32,6 +33,8 @@ class PointDetection(QWidget):
 
         # initialize trackpy widget
         self.trackpy_widget = TrackpyWidget(self.viewer)
+        self.trackpy_widget.detection_started.connect(self._start_detection)
+        self.trackpy_widget.frame_detected.connect(self._add_points)
         self.trackpy_widget.points_detected.connect(self._update_points)
 
         # initialize selection widget
@@ -86,6 +89,18 @@ class PointDetection(QWidget):
         self.setLayout(main_layout)
         self.setMaximumWidth(400)
 
+    def _start_detection(self):
+        """Clear the points of a previous detection from the selection widget"""
+
+        self.selection_widget._start_detection(
+            self.trackpy_widget.intensity_layer
+        )
+
+    def _add_points(self, df: pd.DataFrame):
+        """Show the points of a frame as soon as the trackpy_widget has detected them"""
+
+        self.selection_widget._add_points(df)
+
     def _update_points(self):
         """Call the selection widget to update the points and sliders based on the data calculated in the trackpy_widget class"""
 